@@ -0,0 +1,38 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+from pipeline.parser import parse_benchmark_input, generate_lists
+from pipeline.benchmark import run_benchmark, compare_results
+
+
+####################################################
+#                                                  #
+#                   Execution                      #
+#                                                  #
+####################################################
+
+if __name__ == '__main__':
+    args = parse_benchmark_input()
+
+    # flag regressions of a new result file compared to a reference (exit code 1 if any)
+    if args.compare:
+        exit(1 if compare_results(args.compare[0], args.compare[1], args.threshold) else 0)
+
+    comparison_methods, _ = generate_lists(args.comparison_method, "close")
+    # per-pair scores differing from the batch scores are flagged like regressions (exit code 1 if any)
+    mismatches = run_benchmark(args.probes, args.gallery, args.cohort, args.dimension, comparison_methods,
+                               args.repeats, args.per_pair, args.seed, args.output)
+    exit(1 if mismatches else 0)
+
+
+####################################################
+#                                                  #
+#                Helpful Commands                  #
+#                                                  #
+####################################################
+
+# bin/python benchmark.py -np 100 1000 -ng 130 -nc 43 86 -o output/benchmark-before.json
+# bin/python benchmark.py -cmp output/benchmark-before.json output/benchmark-after.json -t 0.1
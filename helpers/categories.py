@@ -6,6 +6,8 @@
 
 # define categories
 rank_list_comparison = ["mueller2010", "schroff", "mueller2013", "wartmann", "spearman", "kendall", "weighted_kendall"]
+# rank list methods which can be computed from truncated rank lists
+truncated_rank_list_comparison = ["schroff", "mueller2013"]
 standardization_comparison = ["cosine", "braycurtis", "canberra", "cityblock", "sqeuclidean", "minkowski"]
 
 
@@ -20,6 +22,11 @@ def get_rank_list_comparison():
     return rank_list_comparison
 
 
+# used to get list of methods
+def get_truncated_rank_list_comparison():
+    return truncated_rank_list_comparison
+
+
 # used to get list of methods
 def get_standardization_comparison():
     return standardization_comparison
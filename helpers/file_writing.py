@@ -5,7 +5,10 @@
 ####################################################
 
 import csv
+import itertools
+import numpy as np
 import pathlib
+from helpers.colors import Colors
 
 
 ####################################################
@@ -37,14 +40,53 @@ class RecognitionItem:
         return get_average(self.preprocess_close_time, self.preprocess_medium_time, self.preprocess_far_time)
 
 
+class ScoreSink:
+    def __init__(self, filename):
+        self.filename = filename
+        self.probe_reference_ids = []
+        self.probe_subject_ids = []
+        self.gallery_reference_ids = None
+        self.gallery_subject_ids = None
+        self.score_blocks = []
+
+    def add_block(self, probe_samples, gallery_samples, scores):
+        # gallery is the same for all blocks, hence its ids are only recorded once
+        if self.gallery_reference_ids is None:
+            self.gallery_reference_ids = [str(sample.reference_id) for sample in gallery_samples]
+            self.gallery_subject_ids = [str(sample.subject_id) for sample in gallery_samples]
+        self.probe_reference_ids += [str(sample.reference_id) for sample in probe_samples]
+        self.probe_subject_ids += [str(sample.subject_id) for sample in probe_samples]
+        self.score_blocks.append(np.array(scores, dtype=np.float64, ndmin=2))
+
+    def flush(self, score_format, compress):
+        if not self.score_blocks:
+            return
+        if score_format in ["npz", "both"]:
+            save_function = np.savez_compressed if compress else np.savez
+            save_function(self.filename + ".npz",
+                          probe_reference_id=np.array(self.probe_reference_ids),
+                          probe_subject_id=np.array(self.probe_subject_ids),
+                          bio_ref_reference_id=np.array(self.gallery_reference_ids),
+                          bio_ref_subject_id=np.array(self.gallery_subject_ids),
+                          score=np.vstack(self.score_blocks))
+        # csv is written from the collected blocks, hence no npz is written and read back
+        if score_format in ["csv", "both"]:
+            write_scores_csv(self.filename + ".csv", self.probe_reference_ids, self.probe_subject_ids,
+                             self.gallery_reference_ids, self.gallery_subject_ids,
+                             itertools.chain.from_iterable(self.score_blocks))
+        self.score_blocks = []
+
+
 ####################################################
 #                                                  #
 #                 Global Variables                 #
 #                                                  #
 ####################################################
 
-scores_dev = None
-scores_writer = None
+score_sink = None
+# scores are saved as binary matrix (npz), as csv readable by bob or both
+score_format = "csv"
+compress_scores = False
 recognition_dev = None
 recognition_writer = None
 current_recognition = RecognitionItem()
@@ -56,6 +98,18 @@ current_recognition = RecognitionItem()
 #                                                  #
 ####################################################
 
+# setter for score_format
+def set_score_format(value):
+    global score_format
+    score_format = value
+
+
+# setter for compress_scores
+def set_compress_scores(value):
+    global compress_scores
+    compress_scores = value
+
+
 # used to keep track of rates of same comparison method
 def get_average(close_time, medium_time, far_time):
     if close_time and medium_time and far_time:
@@ -78,47 +132,126 @@ def get_average(close_time, medium_time, far_time):
 
 # used to create data files
 def file_creation(comparison_method, protocol, record_output):
-    # initialize file helpers
-    global scores_dev
-    global scores_writer
-    global recognition_dev
-    global recognition_writer
-
     if record_output:
-        # create output directory
-        pathlib.Path("output").mkdir(exist_ok=True)
+        create_score_sink(comparison_method, protocol)
+        open_recognition_file()
+
+
+# used to buffer similarity scores which are written at once when closing the files
+def create_score_sink(comparison_method, protocol):
+    global score_sink
+    score_sink = new_score_sink(comparison_method, protocol)
+
+
+# used to get a score sink which is not written by save_score_block (e.g. one per method of a fused comparison)
+def new_score_sink(comparison_method, protocol):
+    # create output directory
+    pathlib.Path("output").mkdir(exist_ok=True)
+
+    # filename consists of protocol and comparison method (e.g. close-baseline.csv)
+    return ScoreSink("output/" + protocol + "-" + comparison_method)
 
-        # filename consists of protocol and comparison method (e.g. close-baseline.csv)
-        filename = protocol + "-" + comparison_method + ".csv"
-        scores_dev = open("output/" + filename, 'w')
-        scores_writer = csv.writer(scores_dev)
-        scores_header = ['probe_reference_id', 'probe_subject_id',
-                         'bio_ref_reference_id', 'bio_ref_subject_id', 'score']
-        # add header
-        scores_writer.writerow(scores_header)
 
-        # file for recognition rates and runtime, create if non-existent
-        recognition_dev = open("output/recognition-rates-and-runtime.csv", 'a+')
+# used to write all scores of a sink in the chosen score format
+def flush_score_sink(sink):
+    sink.flush(score_format, compress_scores)
+
+
+# used to open the file for recognition rates and runtime
+def open_recognition_file():
+    global recognition_dev
+    global recognition_writer
+
+    # create output directory
+    pathlib.Path("output").mkdir(exist_ok=True)
+
+    # file for recognition rates and runtime, create if non-existent
+    recognition_dev = open("output/recognition-rates-and-runtime.csv", 'a+')
+    recognition_writer = csv.writer(recognition_dev)
+    # seek to beginning of file and check for content
+    recognition_dev.seek(0)
+
+    # add header if file is empty (i.e. was newly created),
+    # otherwise close and re-open to set cursor to end of file
+    if not recognition_dev.readline():
+        recognition_header = ['comparison_method', 'close_recog_rate (%)', 'medium_recog_rate (%)', 'far_recog_rate (%)',
+                              'runtime (ms)', 'preprocess_method', 'preprocess_time (ms)']
+        recognition_writer.writerow(recognition_header)
+    else:
+        recognition_dev.close()
+        recognition_dev = open("output/recognition-rates-and-runtime.csv", 'a')
         recognition_writer = csv.writer(recognition_dev)
-        # seek to beginning of file and check for content
-        recognition_dev.seek(0)
 
-        # add header if file is empty (i.e. was newly created),
-        # otherwise close and re-open to set cursor to end of file
-        if not recognition_dev.readline():
-            recognition_header = ['comparison_method', 'close_recog_rate (%)', 'medium_recog_rate (%)', 'far_recog_rate (%)',
-                                  'runtime (ms)', 'preprocess_method', 'preprocess_time (ms)']
-            recognition_writer.writerow(recognition_header)
-        else:
-            recognition_dev.close()
-            recognition_dev = open("output/recognition-rates-and-runtime.csv", 'a')
-            recognition_writer = csv.writer(recognition_dev)
 
+# used to save a block of similarity scores (one row per probe sample, one column per gallery sample)
+def save_score_block(probe_samples, gallery_samples, scores):
+    if score_sink:
+        score_sink.add_block(probe_samples, gallery_samples, scores)
 
-# used to save similarity scores from each comparison
-def save_scores(data):
-    if scores_writer:
-        scores_writer.writerow(data)
+
+# used to write scores in the csv layout read by bob (one row per probe and gallery sample), the scores are given
+# as one row of gallery scores per probe
+def write_scores_csv(csv_file, probe_reference_ids, probe_subject_ids, gallery_reference_ids, gallery_subject_ids,
+                     score_rows):
+    with open(csv_file, 'w', newline='') as scores_dev:
+        scores_writer = csv.writer(scores_dev)
+        scores_writer.writerow(['probe_reference_id', 'probe_subject_id',
+                                'bio_ref_reference_id', 'bio_ref_subject_id', 'score'])
+        for probe_reference_id, probe_subject_id, scores in zip(probe_reference_ids, probe_subject_ids, score_rows):
+            scores_writer.writerows(zip(itertools.repeat(probe_reference_id), itertools.repeat(probe_subject_id),
+                                        gallery_reference_ids, gallery_subject_ids, scores.tolist()))
+
+
+# used to convert recorded npz scores into the csv layout read by bob
+def export_scores_csv(scores_file, csv_file):
+    with np.load(scores_file) as recorded:
+        write_scores_csv(csv_file, recorded["probe_reference_id"].tolist(), recorded["probe_subject_id"].tolist(),
+                         recorded["bio_ref_reference_id"].tolist(), recorded["bio_ref_subject_id"].tolist(),
+                         recorded["score"])
+
+
+# used to convert recorded npz score files into csv files next to them (e.g. close-wartmann.npz -> close-wartmann.csv)
+def export_score_files(scores_files):
+    missing_files = [scores_file for scores_file in scores_files if not pathlib.Path(scores_file).is_file()]
+    if missing_files:
+        print(f"\n{Colors.BOLD}{Colors.CRED}WARNING:{Colors.ENDC} Score file(s) not found: " + ", ".join(missing_files) +
+              f"\n\n{Colors.BOLD}{Colors.CRED}PROCESS TERMINATED{Colors.ENDC}")
+        exit()
+
+    for scores_file in scores_files:
+        csv_file = str(pathlib.Path(scores_file).with_suffix(".csv"))
+        export_scores_csv(scores_file, csv_file)
+        print(f"{Colors.BOLD}INFO: {Colors.ENDC}Exported scores of '%s' to '%s'" % (scores_file, csv_file))
+
+
+# used to save the best candidates of every probe and the cumulative match characteristic (cmc)
+def save_shortlist(comparison_method, protocol, probe_samples, gallery_samples, candidates, candidate_scores,
+                   cmc):
+    # create output directory
+    pathlib.Path("output").mkdir(exist_ok=True)
+
+    # filename consists of protocol, comparison method and number of candidates (e.g. close-baseline-top10.csv)
+    filename = "output/" + protocol + "-" + comparison_method + "-top" + str(candidates.shape[1]) + ".csv"
+    with open(filename, 'w', newline='') as shortlist_dev:
+        shortlist_writer = csv.writer(shortlist_dev)
+        shortlist_writer.writerow(['probe_reference_id', 'probe_subject_id', 'rank',
+                                   'bio_ref_reference_id', 'bio_ref_subject_id', 'score'])
+        for probe_sample, probe_candidates, scores in zip(probe_samples, candidates, candidate_scores.tolist()):
+            shortlist_writer.writerows(
+                [probe_sample.reference_id, probe_sample.subject_id, rank + 1,
+                 gallery_samples[candidate].reference_id, gallery_samples[candidate].subject_id, score]
+                for rank, (candidate, score) in enumerate(zip(probe_candidates, scores))
+            )
+
+    # file for cmc of all comparison methods and protocols, create if non-existent
+    cmc_file = pathlib.Path("output/cmc-rates.csv")
+    add_header = not cmc_file.is_file()
+    with open(cmc_file, 'a', newline='') as cmc_dev:
+        cmc_writer = csv.writer(cmc_dev)
+        if add_header:
+            cmc_writer.writerow(['comparison_method', 'protocol', 'rank', 'recog_rate (%)'])
+        cmc_writer.writerows([comparison_method, protocol, rank + 1, "{:.2f}".format(rate * 100)]
+                             for rank, rate in enumerate(cmc))
 
 
 # used to turn runtime into string
@@ -185,11 +318,24 @@ def set_preprocess_time(preprocess_method, protocol, preprocess_time):
         current_recognition.preprocess_far_time = preprocess_time
 
 
+# used to discard recorded rates and times which were not saved
+def reset_recognition():
+    global current_recognition
+    current_recognition = RecognitionItem()
+
+
+# used to get the recorded preprocessing time of a protocol
+def get_preprocess_time(protocol):
+    return getattr(current_recognition, "preprocess_" + protocol + "_time")
+
+
 # used to close all files
 def close_files():
-    global scores_dev
+    global score_sink
     global recognition_dev
-    if scores_dev:
-        scores_dev.close()
+    if score_sink:
+        flush_score_sink(score_sink)
+        score_sink = None
     if recognition_dev:
         recognition_dev.close()
+        recognition_dev = None
@@ -0,0 +1,148 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import contextlib
+import json
+import pathlib
+import threading
+import time
+
+
+####################################################
+#                                                  #
+#                    Data Class                    #
+#                                                  #
+####################################################
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.path = None
+        self.start_time_wall = 0
+        self.start_time_cpu = 0
+
+    def __enter__(self):
+        stack = get_stack()
+        stack.append(self.name)
+        self.path = ";".join(stack)
+        self.start_time_wall = time.perf_counter()
+        # cpu time of the current thread, hence spans of loading threads are not mixed up
+        self.start_time_cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self.start_time_wall
+        cpu_time = time.thread_time() - self.start_time_cpu
+        get_stack().pop()
+        record_span(self.path, wall_time, cpu_time)
+        return False
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# spans are only recorded if enabled, otherwise every span is the same context manager doing nothing
+profiling_enabled = False
+disabled_span = contextlib.nullcontext()
+
+# calls, wall time and cpu time of every path of nested spans (e.g. preprocessing;distance_computation)
+span_records = {}
+span_lock = threading.Lock()
+# every thread has its own stack of open spans
+span_stacks = threading.local()
+
+
+# setter for profiling_enabled
+def set_profiling_enabled(value):
+    global profiling_enabled
+    profiling_enabled = value
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to measure a named stage, nested spans are recorded below their parents
+def span(name):
+    if not profiling_enabled:
+        return disabled_span
+
+    return Span(name)
+
+
+# used to get the stack of open spans of the current thread
+def get_stack():
+    if not hasattr(span_stacks, "stack"):
+        span_stacks.stack = []
+
+    return span_stacks.stack
+
+
+# used to add a finished span to the records of its path
+def record_span(path, wall_time, cpu_time):
+    with span_lock:
+        record = span_records.setdefault(path, [0, 0.0, 0.0])
+        record[0] += 1
+        record[1] += wall_time
+        record[2] += cpu_time
+
+
+# used to get the spans recorded so far and to start recording anew (e.g. for every job of a worker process)
+def pop_span_records():
+    with span_lock:
+        records = dict(span_records)
+        span_records.clear()
+
+    return records
+
+
+# used to add the spans recorded by another process (e.g. a worker process) to the records of this process
+def merge_span_records(records):
+    with span_lock:
+        for path, (calls, wall_time, cpu_time) in records.items():
+            record = span_records.setdefault(path, [0, 0.0, 0.0])
+            record[0] += calls
+            record[1] += wall_time
+            record[2] += cpu_time
+
+
+# used to get the wall time of a path without the wall time of its child spans
+def get_self_time(path):
+    child_paths = [child_path for child_path in span_records
+                   if child_path.startswith(path + ";") and child_path.count(";") == path.count(";") + 1]
+
+    return max(span_records[path][1] - sum(span_records[child_path][1] for child_path in child_paths), 0)
+
+
+####################################################
+#                                                  #
+#                   File Writing                   #
+#                                                  #
+####################################################
+
+# used to save the recorded spans as json trace and as collapsed stacks (input of flamegraph.pl or speedscope)
+def save_profile(trace_file="output/profile.json", stack_file="output/profile.folded"):
+    if not profiling_enabled:
+        return
+
+    # create output directory
+    pathlib.Path(trace_file).parent.mkdir(parents=True, exist_ok=True)
+
+    spans = [{"path": path, "name": path.split(";")[-1], "calls": calls, "wall_time": wall_time,
+              "cpu_time": cpu_time, "self_wall_time": get_self_time(path)}
+             for path, (calls, wall_time, cpu_time) in sorted(span_records.items())]
+    with open(trace_file, "w") as trace_dev:
+        json.dump({"spans": spans}, trace_dev, indent=2)
+
+    # one line per path with its self time in microseconds
+    with open(stack_file, "w") as stack_dev:
+        for recorded_span in spans:
+            stack_dev.write("%s %d\n" % (recorded_span["path"], round(recorded_span["self_wall_time"] * 1e6)))
@@ -4,10 +4,24 @@
 #                                                  #
 ####################################################
 
-from pipeline.parser import parse_input, generate_lists
-from pipeline.preprocessing import run_preprocessing
-from pipeline.comparison import run_comparison
-from helpers.colors import print_colorful_start
+from pipeline.parser import parse_input, generate_lists, filter_truncated_methods
+from pipeline.preprocessing import run_preprocessing, set_loading_workers
+from pipeline.cascade import run_cascade
+from pipeline.comparison import run_comparison, set_top_k, set_rank_list_truncation
+from pipeline.evaluation import set_evaluation_enabled, set_evaluation_thresholds
+from pipeline.feature_store import build_feature_store
+from pipeline.manifest import build_manifest
+from pipeline.sweep import run_sweep
+from pipeline.scheduler import run_scheduler
+from pipeline.fused import run_fused
+from pipeline.precision import run_precision_report
+from pipeline.fusion import run_fusion
+from pipeline.matrices import set_embedding_precision, set_memory_budget, set_distance_dtype
+from pipeline.score_matrix import set_score_matrix_enabled, set_tile_size
+from pipeline.cache import set_cache_enabled, set_cache_size_limit, clear_cache
+from helpers.colors import Colors, print_colorful_start
+from helpers.profiling import span, set_profiling_enabled, save_profile
+from helpers.file_writing import set_score_format, set_compress_scores, export_score_files
 from helpers.categories import get_category
 
 
@@ -18,19 +32,103 @@ from helpers.categories import get_category
 ####################################################
 
 if __name__ == '__main__':
-    comparison_methods, protocols, standardization_method, enable_larger_cohort, record_output = parse_input()
-    comparison_methods, protocols = generate_lists(comparison_methods, protocols)
+    args = parse_input()
+    comparison_methods, protocols = generate_lists(args.comparison_method, args.protocol)
+    standardization_method = args.standardization_method
+    enable_larger_cohort = args.enable_larger_cohort
+    record_output = args.record_output
+    set_loading_workers(args.loading_workers)
+    set_cache_enabled(args.use_cache)
+    set_cache_size_limit(args.cache_size * 1024 ** 2)
+    set_score_format(args.score_format)
+    set_compress_scores(args.compress_scores)
+    set_top_k(args.top_k)
+    set_evaluation_enabled(args.evaluate)
+    set_evaluation_thresholds(args.thresholds)
+    set_profiling_enabled(args.profile)
+    set_embedding_precision(args.precision)
+    set_memory_budget(args.memory_budget * 1024 ** 2)
+    set_distance_dtype(args.distance_dtype)
+    set_score_matrix_enabled(args.score_matrix)
+    set_tile_size(args.tile_size)
+
+    # invalidate cached preprocessing artifacts
+    if args.clear_cache:
+        clear_cache()
+
+    # pack extracted features once, afterwards they are loaded from the feature store
+    if args.build_feature_store:
+        build_feature_store()
+
+    # record samples of all protocols once, afterwards they are read from the manifest instead of the database
+    if args.build_manifest:
+        build_manifest()
+
+    # convert recorded npz scores into the csv layout read by bob instead of running comparison methods
+    if args.export_scores:
+        export_score_files(args.export_scores)
+        exit()
+
+    # evaluate a whole parameter grid instead of the chosen comparison methods
+    if args.sweep:
+        run_sweep(args.sweep, args.sweep_values, protocols, standardization_method, enable_larger_cohort)
+        exit()
+
+    # sweeps always use full rank lists, otherwise only the best cohort members are kept if truncation is chosen
+    if args.truncate_rank_lists:
+        set_rank_list_truncation(args.truncate_rank_lists)
+        comparison_methods = filter_truncated_methods(comparison_methods)
+
+    # fuse stored score matrices with a grid of weights instead of running comparison methods
+    if args.fusion:
+        run_fusion(args.fusion, protocols, standardization_method, enable_larger_cohort, args.fusion_normalization,
+                   args.fusion_weights)
+        exit()
+
+    # compare recognition rates and rank lists of lower precision embeddings with the float64 results
+    if args.precision_report:
+        run_precision_report(comparison_methods, protocols, standardization_method, enable_larger_cohort)
+        exit()
+
+    # score all methods of a category in one pass with a single preprocessing per protocol
+    if args.fused:
+        run_fused(comparison_methods, protocols, standardization_method, enable_larger_cohort, record_output)
+        save_profile()
+        exit()
+
+    # run comparison methods and protocols as independent jobs on a pool of processes
+    if args.jobs > 1:
+        run_scheduler(comparison_methods, protocols, standardization_method, enable_larger_cohort, record_output,
+                      args.jobs)
+        save_profile()
+        exit()
+
+    # baseline builds the shortlists of the cascade, hence it is scored against the whole gallery
+    if args.cascade and "baseline" in comparison_methods:
+        print(f"{Colors.BOLD}{Colors.CRED}WARNING:{Colors.ENDC} Cascade does not apply to baseline, which is scored "
+              "against the whole gallery")
 
     for comparison_method in comparison_methods:
         category = get_category(comparison_method)
         for protocol in protocols:
             print_colorful_start(category, comparison_method, protocol, enable_larger_cohort)
-            probe_samples, gallery_samples = run_preprocessing(
-                category, protocol, standardization_method, enable_larger_cohort
-            )
-            run_comparison(probe_samples, gallery_samples, category, comparison_method, protocol, record_output)
+            with span("preprocessing"):
+                probe_samples, gallery_samples = run_preprocessing(
+                    category, protocol, standardization_method, enable_larger_cohort
+                )
+            with span("comparison"):
+                # re-rank the baseline shortlist with the comparison method instead of scoring the whole gallery
+                if args.cascade and category:
+                    run_cascade(probe_samples, gallery_samples, category, comparison_method, protocol,
+                                record_output, args.cascade)
+                else:
+                    run_comparison(probe_samples, gallery_samples, category, comparison_method, protocol,
+                                   record_output)
             print("DONE!")
 
+    # save wall time, cpu time and calls of every stage (if profiling is enabled)
+    save_profile()
+
 
 ####################################################
 #                                                  #
@@ -39,7 +137,13 @@ if __name__ == '__main__':
 ####################################################
 
 # bin/python main.py -c baseline -p close -r
+# bin/python main.py -c baseline -p close -bfs -bm
 # bin/bob bio roc -v -o baseline.pdf baseline.csv
+# bin/python main.py -c baseline -p close -e -th -0.5 -0.4
+# bin/python main.py -c all -p all -pcr
+# bin/python main.py -c wartmann -p far -sm -mb 64
+# bin/python main.py -p far -fs baseline wartmann -fn znorm rank -fw 0 0.1 0.2 0.3 0.4 0.5 0.6 0.7 0.8 0.9 1
+# bin/python main.py -c rank_list_comparison -p close -pr && flamegraph.pl output/profile.folded > profile.svg
 # bin/bob bio pipelines vanilla-biometrics scface-close ./simple_pipe.py -vvv -o samples_pipe_all -c --group eval
 # bin/bob bio pipelines vanilla-biometrics scface-close iresnet100
 # bin/bob bio evaluate ./results/scores-dev.csv
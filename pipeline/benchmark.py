@@ -0,0 +1,226 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import itertools
+import json
+import numpy as np
+import pathlib
+import pipeline.comparison as comparison
+import platform
+import scipy
+import statistics
+import time
+import types
+from helpers.categories import get_category
+from helpers.colors import Colors
+from pipeline.cohort import CohortModel
+from pipeline.comparison import get_comparison_matrices, compare_matrices, get_similarity_scores, get_matrix_function, \
+    set_schroff_k
+from pipeline.preprocessing import generate_rank_list, standardize, subtract_mean, omitted
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# timed functions of the preprocessing and comparison
+preprocessing_functions = ["cohort_model", "generate_rank_list", "standardize", "subtract_mean", "omitted"]
+
+# spread of samples around the centre of their subject (surveillance samples are noisier than mugshots)
+mugshot_noise = 0.5
+surveillance_noise = 1.0
+
+
+####################################################
+#                                                  #
+#                  Data Generation                 #
+#                                                  #
+####################################################
+
+# used to create a sample with the attributes of the database samples and synthetic features
+def generate_sample(rng, centre, noise, key, subject_id, capture, distance=None):
+    return types.SimpleNamespace(key=key, reference_id=key, subject_id=subject_id, capture=capture, distance=distance,
+                                 features=centre + noise * rng.standard_normal(len(centre)))
+
+
+# used to create probes, gallery and cohort of the given sizes, where every probe belongs to a gallery subject
+# and the cohort consists of other subjects with one mugshot and two surveillance samples each
+def generate_dataset(number_of_probes, number_of_gallery, number_of_cohort, dimension, seed):
+    rng = np.random.default_rng(seed)
+    gallery_centres = rng.standard_normal((number_of_gallery, dimension))
+    cohort_centres = rng.standard_normal((number_of_cohort, dimension))
+
+    gallery_samples = [generate_sample(rng, gallery_centres[subject], mugshot_noise, "gallery/%d" % subject, subject,
+                                       "mugshot")
+                       for subject in range(number_of_gallery)]
+    probe_samples = [generate_sample(rng, gallery_centres[probe % number_of_gallery], surveillance_noise,
+                                     "probes/%d" % probe, probe % number_of_gallery, "surveillance", "close")
+                     for probe in range(number_of_probes)]
+    cohort_samples = []
+    for subject in range(number_of_cohort):
+        subject_id = number_of_gallery + subject
+        cohort_samples.append(generate_sample(rng, cohort_centres[subject], mugshot_noise,
+                                              "cohort/%d_mugshot" % subject, subject_id, "mugshot"))
+        for camera in range(2):
+            cohort_samples.append(generate_sample(rng, cohort_centres[subject], surveillance_noise,
+                                                  "cohort/%d_close_%d" % (subject, camera), subject_id,
+                                                  "surveillance", "close"))
+
+    return probe_samples, gallery_samples, cohort_samples
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to time a function, returns minimum and median wall time and minimum cpu time (in seconds)
+def time_function(function, repeats):
+    wall_times = []
+    cpu_times = []
+    for _ in range(repeats):
+        start_time_wall = time.perf_counter()
+        start_time_cpu = time.process_time()
+        function()
+        cpu_times.append(time.process_time() - start_time_cpu)
+        wall_times.append(time.perf_counter() - start_time_wall)
+
+    return min(wall_times), statistics.median(wall_times), min(cpu_times)
+
+
+# used to describe the environment the results were measured in
+def get_environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+            "machine": platform.machine(), "processor": platform.processor(), "system": platform.system()}
+
+
+# used to identify a result across result files
+def get_result_key(result):
+    return result["kind"], result["name"], result["probes"], result["gallery"], result["cohort"], result["dimension"]
+
+
+# used to turn a runtime into a string in milliseconds
+def round_runtime(runtime):
+    return "{:.4f}".format(runtime * 1000)
+
+
+####################################################
+#                                                  #
+#                    Algorithm                     #
+#                                                  #
+####################################################
+
+# used to time all preprocessing functions and comparison methods for one size of the grid
+def benchmark_size(sizes, comparison_methods, repeats, per_pair, seed):
+    number_of_probes, number_of_gallery, number_of_cohort, dimension = sizes
+    probe_samples, gallery_samples, cohort_samples = generate_dataset(*sizes, seed)
+    cohort_model = CohortModel()
+    cohort_model.build(cohort_samples, "close")
+    set_schroff_k(number_of_cohort)
+
+    results = []
+
+    def add_result(kind, name, timings, **details):
+        wall_time, median_wall_time, cpu_time = timings
+        results.append({"kind": kind, "name": name, "probes": number_of_probes, "gallery": number_of_gallery,
+                        "cohort": number_of_cohort, "dimension": dimension, "wall_time": wall_time,
+                        "median_wall_time": median_wall_time, "cpu_time": cpu_time, "repeats": repeats, **details})
+        print(f"{Colors.BOLD}INFO: {Colors.ENDC}" + kind + f" {Colors.BOLD}{Colors.CRED}" + name +
+              f"{Colors.ENDC} (probes: %d, gallery: %d, cohort: %d, dimension: %d): " % sizes +
+              round_runtime(wall_time) + " ms")
+
+    # preprocessing of the probes (the gallery is preprocessed the same way)
+    for function_name in preprocessing_functions:
+        if function_name == "cohort_model":
+            timings = time_function(lambda: CohortModel().build(cohort_samples, "close"), repeats)
+        else:
+            preprocessing_function = eval(function_name)
+            timings = time_function(
+                lambda: preprocessing_function(probe_samples, cohort_model.get_probe_matrix("close")), repeats
+            )
+        add_result("preprocessing", function_name, timings)
+
+    # lists used by the comparison methods (timed preprocessing functions overwrite the standardized lists)
+    for samples, cohort_matrix in [(probe_samples, cohort_model.get_probe_matrix("close")),
+                                   (gallery_samples, cohort_model.gallery_matrix)]:
+        generate_rank_list(samples, cohort_matrix)
+        standardize(samples, cohort_matrix)
+
+    for comparison_method in comparison_methods:
+        category = get_category(comparison_method)
+        probe_matrix, gallery_matrix = get_comparison_matrices(probe_samples, gallery_samples, category)
+        timings = time_function(lambda: compare_matrices(probe_matrix, gallery_matrix, probe_samples, gallery_samples,
+                                                         comparison_method), repeats)
+        add_result("comparison", comparison_method, timings)
+
+        # per-pair functions are only timed on request as they are orders of magnitude slower
+        if per_pair and category:
+            comparison_function = getattr(comparison, comparison_method)
+            timings = time_function(lambda: [get_similarity_scores(probe_sample, gallery_samples, comparison_function)
+                                             for probe_sample in probe_samples], repeats)
+            # both paths have to compute the same scores, otherwise a faster kernel could hide a wrong one
+            agrees = bool(np.allclose(
+                [get_similarity_scores(probe_sample, gallery_samples, comparison_function)
+                 for probe_sample in probe_samples],
+                get_matrix_function(comparison_method)(probe_matrix, gallery_matrix)
+            ))
+            if not agrees:
+                print(f"{Colors.BOLD}{Colors.CRED}WARNING:{Colors.ENDC} Per-pair and batch scores of " +
+                      comparison_method + " differ (probes: %d, gallery: %d, cohort: %d, dimension: %d)" % sizes)
+            add_result("per_pair", comparison_method, timings, agrees_with_batch=agrees)
+
+    return results
+
+
+# used to time all methods on every combination of the chosen sizes and to save the results as json, returns the
+# number of per-pair results which differ from the batch scores
+def run_benchmark(probe_sizes, gallery_sizes, cohort_sizes, dimensions, comparison_methods, repeats, per_pair, seed,
+                  output_file):
+    results = []
+    for sizes in itertools.product(probe_sizes, gallery_sizes, cohort_sizes, dimensions):
+        results += benchmark_size(sizes, comparison_methods, repeats, per_pair, seed)
+
+    pathlib.Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, "w") as output_dev:
+        json.dump({"environment": get_environment(), "seed": seed, "results": results}, output_dev, indent=2)
+
+    print(f"{Colors.BOLD}INFO: {Colors.ENDC}Saved %d results to '%s'" % (len(results), output_file))
+
+    return sum(not result.get("agrees_with_batch", True) for result in results)
+
+
+# used to compare the wall times of two result files, returns the number of regressions (new result slower than
+# the reference by more than the threshold)
+def compare_results(reference_file, new_file, threshold):
+    with open(reference_file) as reference_dev:
+        reference_results = {get_result_key(result): result for result in json.load(reference_dev)["results"]}
+    with open(new_file) as new_dev:
+        new_results = json.load(new_dev)["results"]
+
+    regressions = 0
+    for result in new_results:
+        reference_result = reference_results.get(get_result_key(result))
+        if reference_result is None:
+            continue
+        ratio = result["wall_time"] / max(reference_result["wall_time"], 1e-12)
+        if ratio > 1 + threshold:
+            regressions += 1
+            status = f"{Colors.BOLD}{Colors.CRED}REGRESSION{Colors.ENDC}"
+        elif ratio < 1 - threshold:
+            status = f"{Colors.CCYAN}improvement{Colors.ENDC}"
+        else:
+            status = "unchanged"
+        print(result["kind"] + " " + result["name"] +
+              " (probes: %d, gallery: %d, cohort: %d, dimension: %d): " % get_result_key(result)[2:] +
+              round_runtime(reference_result["wall_time"]) + " ms -> " + round_runtime(result["wall_time"]) +
+              " ms (x%.2f) " % ratio + status)
+
+    print(f"{Colors.BOLD}INFO: {Colors.ENDC}%d regression(s) above %.0f%%" % (regressions, threshold * 100))
+
+    return regressions
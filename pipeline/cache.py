@@ -0,0 +1,171 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import hashlib
+import numpy as np
+import os
+import pathlib
+from helpers.colors import Colors
+from pipeline.feature_store import store_directory_path, features_filename, index_filename
+
+
+####################################################
+#                                                  #
+#                 Path Declaration                 #
+#                                                  #
+####################################################
+
+# used to combine with feature keys for fingerprints and to store cached preprocessing artifacts
+file_path = str(pathlib.Path().resolve())
+feature_directory_path = file_path + "/samples_pipe_all/samplewrapper-2/"
+cache_directory_path = file_path + "/cache/preprocessing/"
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# increase whenever the layout or computation of cached artifacts changes
+cache_version = 1
+# cache is only used if enabled
+cache_enabled = False
+# upper bound (in bytes) for the size of all cached artifacts
+cache_size_limit = 1024 ** 3
+
+
+# setter for cache_enabled
+def set_cache_enabled(value):
+    global cache_enabled
+    cache_enabled = value
+
+
+# setter for cache_size_limit
+def set_cache_size_limit(value):
+    global cache_size_limit
+    cache_size_limit = value
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to fingerprint the features of all samples by size and modification time of the files they are loaded from
+def get_fingerprint(samples):
+    fingerprint = hashlib.sha256()
+    store_files = [pathlib.Path(store_directory_path) / features_filename,
+                   pathlib.Path(store_directory_path) / index_filename]
+
+    # features are loaded from the feature store if it was built, otherwise from one file per sample
+    if all(store_file.is_file() for store_file in store_files):
+        files = store_files
+    else:
+        files = [pathlib.Path(feature_directory_path + key + ".h5") for key in sorted(sample.key for sample in samples)]
+
+    for file in files:
+        fingerprint.update(str(file).encode())
+        if file.is_file():
+            file_stat = file.stat()
+            fingerprint.update(b"%d:%d" % (file_stat.st_size, file_stat.st_mtime_ns))
+
+    return fingerprint.hexdigest()
+
+
+# used to derive the content address of preprocessed lists, returns None if the cache is disabled
+def get_cache_key(protocol, enable_larger_cohort, preprocess_method, samples):
+    if not cache_enabled:
+        return None
+
+    identifier = "%d|%s|%s|%s|%s" % (cache_version, protocol, enable_larger_cohort, preprocess_method,
+                                     get_fingerprint(samples))
+    return hashlib.sha256(identifier.encode()).hexdigest()
+
+
+# used to get the path of a cached artifact
+def get_cache_file(cache_key):
+    return pathlib.Path(cache_directory_path) / (cache_key + ".npz")
+
+
+# used to load cached lists, returns None if they are not cached or were computed for other samples
+def load_cached_lists(cache_key, probe_samples, gallery_samples):
+    if cache_key is None or not get_cache_file(cache_key).is_file():
+        return None
+
+    cache_file = get_cache_file(cache_key)
+    with np.load(cache_file) as cached:
+        if cached["probe_keys"].tolist() != [sample.key for sample in probe_samples] or \
+                cached["gallery_keys"].tolist() != [sample.key for sample in gallery_samples]:
+            return None
+        probe_lists, gallery_lists, cohort_size = cached["probe_lists"], cached["gallery_lists"], cached["cohort_size"]
+
+    # mark as recently used for the eviction
+    os.utime(cache_file)
+
+    return probe_lists, gallery_lists, int(cohort_size)
+
+
+# used to save preprocessed lists and evict least recently used artifacts above the size limit
+def save_cached_lists(cache_key, probe_samples, gallery_samples, probe_lists, gallery_lists, cohort_size):
+    if cache_key is None:
+        return
+
+    save_cached_arrays(cache_key, {"probe_lists": probe_lists, "gallery_lists": gallery_lists,
+                                   "cohort_size": cohort_size,
+                                   "probe_keys": np.array([sample.key for sample in probe_samples]),
+                                   "gallery_keys": np.array([sample.key for sample in gallery_samples])})
+
+
+# used to load all arrays of a cached artifact, returns None if it is not cached
+def load_cached_arrays(cache_key):
+    if cache_key is None or not get_cache_file(cache_key).is_file():
+        return None
+
+    cache_file = get_cache_file(cache_key)
+    with np.load(cache_file) as cached:
+        arrays = {name: cached[name] for name in cached.files}
+
+    # mark as recently used for the eviction
+    os.utime(cache_file)
+
+    return arrays
+
+
+# used to save arrays as cached artifact and evict least recently used artifacts above the size limit
+def save_cached_arrays(cache_key, arrays):
+    if cache_key is None:
+        return
+
+    pathlib.Path(cache_directory_path).mkdir(parents=True, exist_ok=True)
+    # write to temporary file first, hence a cancelled run never leaves a partial artifact
+    temporary_file = get_cache_file(cache_key).with_suffix(".tmp.npz")
+    np.savez(temporary_file, **arrays)
+    os.replace(temporary_file, get_cache_file(cache_key))
+
+    evict_cache(cache_size_limit)
+
+
+# used to delete least recently used artifacts until all cached artifacts fit into the size limit
+def evict_cache(size_limit):
+    cache_files = sorted(pathlib.Path(cache_directory_path).glob("*.npz"), key=lambda file: file.stat().st_mtime)
+    cache_size = sum(cache_file.stat().st_size for cache_file in cache_files)
+
+    for cache_file in cache_files:
+        if cache_size <= size_limit:
+            break
+        cache_size -= cache_file.stat().st_size
+        cache_file.unlink()
+
+
+# used to invalidate all cached artifacts
+def clear_cache():
+    cache_files = list(pathlib.Path(cache_directory_path).glob("*.npz"))
+    for cache_file in cache_files:
+        cache_file.unlink()
+
+    print(f"{Colors.BOLD}INFO: {Colors.ENDC}Removed %d cached preprocessing artifact(s)" % len(cache_files))
@@ -0,0 +1,114 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import csv
+import numpy as np
+import pathlib
+import time
+from helpers.colors import Colors
+from helpers.profiling import span
+from pipeline.comparison import baseline, get_comparison_matrices, get_matrix_function, get_top_candidates
+from pipeline.matrices import get_blocks
+from pipeline.preprocessing import load_missing_features
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to shortlist the best gallery candidates of every probe with the cosine baseline (ordered by decreasing score)
+def get_baseline_shortlist(probe_features, gallery_features, shortlist_size):
+    candidate_blocks = []
+    for block in get_blocks(len(probe_features), len(gallery_features) * np.dtype(np.float64).itemsize):
+        candidates, _ = get_top_candidates(baseline(probe_features[block], gallery_features), shortlist_size)
+        candidate_blocks.append(candidates)
+
+    return np.vstack(candidate_blocks)
+
+
+# used to score every probe against its shortlisted gallery candidates only, returns the best candidate per probe
+def rerank_shortlist(matrix_function, probe_matrix, gallery_matrix, candidates):
+    best_candidates = np.empty(len(candidates), dtype=np.int64)
+    for probe_index, probe_candidates in enumerate(candidates):
+        scores = matrix_function(probe_matrix[probe_index:probe_index + 1], gallery_matrix[probe_candidates])
+        best_candidates[probe_index] = probe_candidates[np.argmax(scores[0])]
+
+    return best_candidates
+
+
+# used to count probes whose best candidate has the same subject_id
+def count_matches(probe_samples, gallery_samples, best_candidates):
+    return sum(probe_sample.subject_id == gallery_samples[best_candidate].subject_id
+               for probe_sample, best_candidate in zip(probe_samples, best_candidates))
+
+
+# used to save recognition rate and runtime of every shortlist size
+def save_cascade(comparison_method, protocol, cascade_results):
+    # create output directory
+    pathlib.Path("output").mkdir(exist_ok=True)
+
+    # file for cascades of all comparison methods and protocols, create if non-existent
+    cascade_file = pathlib.Path("output/cascade-rates-and-runtime.csv")
+    add_header = not cascade_file.is_file()
+    with open(cascade_file, 'a', newline='') as cascade_dev:
+        cascade_writer = csv.writer(cascade_dev)
+        if add_header:
+            cascade_writer.writerow(['comparison_method', 'protocol', 'shortlist_size', 'recog_rate (%)',
+                                     'runtime (ms)', 'shortlist_runtime (ms)'])
+        cascade_writer.writerows(
+            [comparison_method, protocol, shortlist_size, recognition_rate, "{:.4f}".format(runtime * 1000),
+             "{:.4f}".format(shortlist_runtime * 1000)]
+            for shortlist_size, recognition_rate, runtime, shortlist_runtime in cascade_results
+        )
+
+
+####################################################
+#                                                  #
+#                    Algorithm                     #
+#                                                  #
+####################################################
+
+# used to run a comparison method as second stage on the baseline shortlist of every probe, for every shortlist size
+def run_cascade(probe_samples, gallery_samples, category, comparison_method, protocol, record_output,
+                shortlist_sizes):
+    # features are not loaded if the lists were cached or the gallery lists were shared
+    load_missing_features(probe_samples + gallery_samples)
+
+    # stage one: cosine baseline on the features
+    start_time_cpu = time.process_time()
+    probe_features, gallery_features = get_comparison_matrices(probe_samples, gallery_samples, "")
+    stage_one_time = time.process_time() - start_time_cpu
+
+    # stage two: chosen comparison method on the preprocessed lists
+    start_time_cpu = time.process_time()
+    probe_matrix, gallery_matrix = get_comparison_matrices(probe_samples, gallery_samples, category)
+    stage_two_time = time.process_time() - start_time_cpu
+    matrix_function = get_matrix_function(comparison_method)
+
+    cascade_results = []
+    for shortlist_size in shortlist_sizes:
+        start_time_cpu = time.process_time()
+        with span("shortlisting"):
+            candidates = get_baseline_shortlist(probe_features, gallery_features, shortlist_size)
+        shortlist_runtime = stage_one_time + time.process_time() - start_time_cpu
+
+        start_time_cpu = time.process_time()
+        with span("scoring"):
+            best_candidates = rerank_shortlist(matrix_function, probe_matrix, gallery_matrix, candidates)
+        runtime = shortlist_runtime + stage_two_time + time.process_time() - start_time_cpu
+
+        recognition_rate = "{:.2f}".format(count_matches(probe_samples, gallery_samples, best_candidates) /
+                                           len(probe_samples) * 100)
+        cascade_results.append((shortlist_size, recognition_rate, runtime, shortlist_runtime))
+        print(f"{Colors.BOLD}INFO: {Colors.ENDC}Cascade of {Colors.BOLD}{Colors.CRED}" + comparison_method +
+              f"{Colors.ENDC} with protocol {Colors.CCYAN}" + protocol + f"{Colors.ENDC} and shortlist size " +
+              str(shortlist_size) + ": " + recognition_rate + "%")
+
+    if record_output:
+        with span("output_writing"):
+            save_cascade(comparison_method, protocol, cascade_results)
@@ -0,0 +1,153 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import hashlib
+import numpy as np
+from helpers.profiling import span
+from pipeline.cache import get_cache_key, load_cached_arrays, save_cached_arrays
+from pipeline.matrices import stack_samples, normalize_rows
+
+
+####################################################
+#                                                  #
+#                    Data Class                    #
+#                                                  #
+####################################################
+
+class CohortModel:
+    def __init__(self, gallery_subject_ids=None, gallery_matrix=None, probe_subject_ids=None, probe_matrices=None):
+        # normalized mugshot features in order of the subject ids (identical for all protocols)
+        self.gallery_subject_ids = gallery_subject_ids
+        self.gallery_matrix = gallery_matrix
+        # normalized averaged surveillance features of every protocol in order of the subject ids
+        self.probe_subject_ids = probe_subject_ids or {}
+        self.probe_matrices = probe_matrices or {}
+
+    # cohort samples whose features are needed to build the missing sides of a protocol
+    def get_required_samples(self, cohort_samples, protocol):
+        required_samples = []
+        if self.gallery_matrix is None:
+            required_samples += get_mugshot_samples(cohort_samples)
+        if protocol not in self.probe_matrices:
+            required_samples += get_surveillance_samples(cohort_samples, protocol)
+
+        return required_samples
+
+    # builds the missing sides of a protocol, the mugshot side is only built once
+    def build(self, cohort_samples, protocol):
+        if self.gallery_matrix is None:
+            with span("cohort_split"):
+                mugshot_samples = get_mugshot_samples(cohort_samples)
+            self.gallery_subject_ids, self.gallery_matrix = group_by_subject(mugshot_samples)
+        if protocol not in self.probe_matrices:
+            with span("cohort_split"):
+                surveillance_samples = get_surveillance_samples(cohort_samples, protocol)
+            self.probe_subject_ids[protocol], self.probe_matrices[protocol] = group_by_subject(surveillance_samples)
+
+    def has_protocol(self, protocol):
+        return self.gallery_matrix is not None and protocol in self.probe_matrices
+
+    def get_probe_matrix(self, protocol):
+        return self.probe_matrices[protocol]
+
+    # mugshot side and probe side of every protocol are cached apart, hence each side is identified by its samples
+    def get_gallery_arrays(self):
+        return {"subject_ids": self.gallery_subject_ids, "matrix": self.gallery_matrix}
+
+    def get_probe_arrays(self, protocol):
+        return {"subject_ids": self.probe_subject_ids[protocol], "matrix": self.probe_matrices[protocol]}
+
+    # adds a cached mugshot side (nothing is added if it was not cached)
+    def set_gallery_arrays(self, arrays):
+        if arrays:
+            self.gallery_subject_ids, self.gallery_matrix = arrays["subject_ids"], arrays["matrix"]
+
+    # adds a cached probe side of a protocol (nothing is added if it was not cached)
+    def set_probe_arrays(self, protocol, arrays):
+        if arrays:
+            self.probe_subject_ids[protocol], self.probe_matrices[protocol] = arrays["subject_ids"], arrays["matrix"]
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# cohort models of all cohorts used so far, shared by all protocols and comparison methods
+cohort_models = {}
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to get the cohort samples captured as mugshot (gallery side of the cohort)
+def get_mugshot_samples(cohort_samples):
+    return [sample for sample in cohort_samples if str(sample.capture) == "mugshot"]
+
+
+# used to get the cohort samples captured by surveillance cameras at the protocol's distance (probe side)
+def get_surveillance_samples(cohort_samples, protocol):
+    return [sample for sample in cohort_samples
+            if str(sample.capture) == "surveillance" and str(sample.distance) == protocol]
+
+
+# used to average the features of all samples with the same subject_id and normalize the averages,
+# returns the sorted subject ids and one row per subject
+def group_by_subject(samples):
+    with span("cohort_averaging"):
+        return average_by_subject(samples)
+
+
+# used to average the features of all samples with the same subject_id (see group_by_subject)
+def average_by_subject(samples):
+    features = stack_samples(samples).astype(np.float64)
+    subject_ids, inverse = np.unique(np.array([sample.subject_id for sample in samples]), return_inverse=True)
+    # sum the features of every subject at once and divide by the number of samples per subject
+    sums = np.zeros((len(subject_ids), features.shape[1]))
+    np.add.at(sums, inverse, features)
+
+    return subject_ids, normalize_rows(sums / np.bincount(inverse)[:, None])
+
+
+# used to identify a cohort by the keys of its samples
+def get_cohort_id(cohort_samples):
+    return hashlib.sha256("|".join(sorted(sample.key for sample in cohort_samples)).encode()).hexdigest()
+
+
+# used to get the cohort model of a cohort with the sides of a protocol loaded from the cache (if enabled),
+# models are identified by the mugshot side, hence protocols whose cohorts only differ in surveillance samples
+# (e.g. the larger cohort) share one model and its mugshot side
+def get_cohort_model(cohort_samples, protocol, enable_larger_cohort):
+    cohort_model = cohort_models.setdefault(get_cohort_id(get_mugshot_samples(cohort_samples)), CohortModel())
+    gallery_cache_key, probe_cache_key = get_cohort_cache_keys(cohort_samples, protocol, enable_larger_cohort)
+    if cohort_model.gallery_matrix is None:
+        cohort_model.set_gallery_arrays(load_cached_arrays(gallery_cache_key))
+    if protocol not in cohort_model.probe_matrices:
+        cohort_model.set_probe_arrays(protocol, load_cached_arrays(probe_cache_key))
+
+    return cohort_model
+
+
+# used to get the cache keys of the mugshot side and of the probe side of a protocol (None if the cache is disabled),
+# every side is fingerprinted by its own samples, hence re-extracted features never return a stale side
+def get_cohort_cache_keys(cohort_samples, protocol, enable_larger_cohort):
+    gallery_cache_key = get_cache_key("cohort", enable_larger_cohort, "cohort-gallery",
+                                      get_mugshot_samples(cohort_samples))
+    probe_cache_key = get_cache_key(protocol, enable_larger_cohort, "cohort-probe",
+                                    get_surveillance_samples(cohort_samples, protocol))
+
+    return gallery_cache_key, probe_cache_key
+
+
+# used to save both sides of a protocol to the cache (if enabled) after they were built
+def save_cohort_model(cohort_model, cohort_samples, protocol, enable_larger_cohort):
+    gallery_cache_key, probe_cache_key = get_cohort_cache_keys(cohort_samples, protocol, enable_larger_cohort)
+    save_cached_arrays(gallery_cache_key, cohort_model.get_gallery_arrays())
+    save_cached_arrays(probe_cache_key, cohort_model.get_probe_arrays(protocol))
@@ -6,10 +6,18 @@
 
 import math
 import numpy as np
+import scipy.sparse
 import scipy.spatial
 import scipy.stats
 import time
-from helpers.file_writing import file_creation, save_scores, save_results, close_files
+from helpers.file_writing import file_creation, save_score_block, save_shortlist, save_results, close_files
+from helpers.profiling import span
+import pipeline.score_matrix as score_matrix
+from pipeline.score_matrix import score_tiles, get_score_matrix_directory, get_resumed_runtime
+from pipeline.evaluation import create_evaluation, add_evaluation_block, get_evaluation_runtime, finish_evaluation, \
+    save_evaluation, get_genuine_ranks, get_cmc
+from pipeline.matrices import stack_samples, stack_rank_lists, normalize_rows, get_blocks, apply_pairwise, \
+    distance_matrix, prepare_embeddings, embedding_product
 
 
 ####################################################
@@ -26,6 +34,20 @@ wartmann_alpha = 1
 wartmann_beta = 1
 minkowski_p = 2
 
+# parameters every comparison method depends on (methods without parameters are not listed), schroff_k follows from
+# the cohort size, hence it is identified by the lists
+method_parameters = {
+    "mueller2013": ["mueller2013_lambda"],
+    "wartmann": ["wartmann_alpha", "wartmann_beta"],
+    "minkowski": ["minkowski_p"]
+}
+
+# number of best cohort members kept per rank list (schroff and mueller2013 only), zero keeps the full rank lists
+rank_list_truncation = 0
+
+# number of best gallery candidates kept per probe (shortlist and cmc), zero keeps only the best match
+top_k = 0
+
 
 # setter for schroff_k
 def set_schroff_k(value):
@@ -33,29 +55,29 @@ def set_schroff_k(value):
     schroff_k = value
 
 
+# setter for rank_list_truncation
+def set_rank_list_truncation(value):
+    global rank_list_truncation
+    rank_list_truncation = value
+
+
+# setter for top_k
+def set_top_k(value):
+    global top_k
+    top_k = value or 0
+
+
 ####################################################
 #                                                  #
 #                Comparison Methods                #
 #                                                  #
 ####################################################
 
-# used to calculate cosine distances between one probe and all gallery samples (used for baseline)
-def baseline(probe_sample, gallery_samples):
-    # instantiate list for calculated cosine distances between probe sample and all gallery samples
-    cosine_distances = []
-
-    for gallery_sample in gallery_samples:
-        # calculate and save cosine distance between probe and current gallery sample
-        cosine_distance = scipy.spatial.distance.cosine(probe_sample.features, gallery_sample.features)
-        cosine_distances.append(cosine_distance)
-
-        data = [probe_sample.reference_id, probe_sample.subject_id,
-                gallery_sample.reference_id, gallery_sample.subject_id,
-                -cosine_distance]
-        # save to external spreadsheet to determine VP
-        save_scores(data)
-
-    return -np.array(cosine_distances)
+# used to calculate similarity scores between all probe and all gallery samples at once (used for baseline)
+def baseline(probe_features, gallery_features):
+    # features are normalized beforehand, hence the cosine distance is one minus the dot product
+    # and the similarity score (negative cosine distance) is the dot product minus one
+    return embedding_product(probe_features, gallery_features) - 1
 
 
 ####################################################
@@ -69,7 +91,7 @@ def mueller2010(probe_sample, gallery_sample):
     # initialize score
     similarity_score = 0
     # loop through rank lists and compute similarity
-    for probe_rank, gallery_rank in zip(probe_sample.rank_list, gallery_sample.rank_list):
+    for probe_rank, gallery_rank in zip(probe_sample.rank_list.tolist(), gallery_sample.rank_list.tolist()):
         similarity_score += 1 / math.sqrt(probe_rank + gallery_rank + 1)
 
     return similarity_score
@@ -80,7 +102,7 @@ def mueller2013(probe_sample, gallery_sample):
     # initialize score
     similarity_score = 0
     # loop through rank lists and compute similarity
-    for probe_rank, gallery_rank in zip(probe_sample.rank_list, gallery_sample.rank_list):
+    for probe_rank, gallery_rank in zip(probe_sample.rank_list.tolist(), gallery_sample.rank_list.tolist()):
         similarity_score += mueller2013_lambda ** (probe_rank + gallery_rank)
 
     return similarity_score
@@ -91,7 +113,7 @@ def schroff(probe_sample, gallery_sample):
     # initialize score
     similarity_score = 0
     # loop through rank lists and compute similarity
-    for probe_rank, gallery_rank in zip(probe_sample.rank_list, gallery_sample.rank_list):
+    for probe_rank, gallery_rank in zip(probe_sample.rank_list.tolist(), gallery_sample.rank_list.tolist()):
         similarity_score += max(schroff_k + 1 - probe_rank, 0) * max(schroff_k + 1 - gallery_rank, 0)
 
     return similarity_score
@@ -144,7 +166,7 @@ def wartmann(probe_sample, gallery_sample):
     # initialize score
     similarity_score = 0
     # loop through rank lists and compute similarity
-    for probe_rank, gallery_rank in zip(probe_sample.rank_list, gallery_sample.rank_list):
+    for probe_rank, gallery_rank in zip(probe_sample.rank_list.tolist(), gallery_sample.rank_list.tolist()):
         similarity_score += ((abs(probe_rank - gallery_rank) / number_of_ranks) ** wartmann_alpha) * \
                             ((abs((probe_rank / (number_of_ranks * 0.5)) - 1) ** wartmann_beta) +
                              (abs((gallery_rank / (number_of_ranks * 0.5)) - 1) ** wartmann_beta))
@@ -152,6 +174,85 @@ def wartmann(probe_sample, gallery_sample):
     return -similarity_score
 
 
+####################################################
+#                                                  #
+#              Batch Rank List Method              #
+#                                                  #
+####################################################
+
+# compute similarities of all probe and gallery rank lists with the help of mueller's formula 2010
+def mueller2010_matrix(probe_ranks, gallery_ranks):
+    return apply_pairwise(
+        lambda probe_tile, gallery_tile: np.sum(1 / np.sqrt(probe_tile + gallery_tile + 1), axis=-1),
+        probe_ranks.astype(np.float64), gallery_ranks.astype(np.float64)
+    )
+
+
+# compute similarities of all probe and gallery rank lists with the help of mueller's formula 2013
+def mueller2013_matrix(probe_ranks, gallery_ranks):
+    # truncated rank lists only contribute where a cohort member is among the best of both lists
+    if rank_list_truncation:
+        weights = np.power(mueller2013_lambda, np.arange(probe_ranks.shape[1], dtype=np.float64))
+        return get_truncated_product(probe_ranks, gallery_ranks, weights)
+
+    # lambda ** (probe_rank + gallery_rank) factorizes, hence the sum over all ranks is a matrix product
+    return np.power(mueller2013_lambda, probe_ranks.astype(np.float64)) @ \
+        np.power(mueller2013_lambda, gallery_ranks.astype(np.float64)).T
+
+
+# compute similarities of all probe and gallery rank lists with the help of schroff's formula
+def schroff_matrix(probe_ranks, gallery_ranks):
+    # truncated rank lists only hold the best cohort members, hence the scores are exact if the truncation exceeds
+    # schroff_k (ranks above schroff_k have no weight)
+    if rank_list_truncation:
+        weights = np.maximum(schroff_k + 1 - np.arange(probe_ranks.shape[1], dtype=np.float64), 0)
+        return get_truncated_product(probe_ranks, gallery_ranks, weights)
+
+    # both factors only depend on one rank, hence the sum over all ranks is a matrix product
+    return np.maximum(schroff_k + 1 - probe_ranks.astype(np.float64), 0) @ \
+        np.maximum(schroff_k + 1 - gallery_ranks.astype(np.float64), 0).T
+
+
+# compute similarities of all probe and gallery rank lists with the help of wartmann's parametric formula
+def wartmann_matrix(probe_ranks, gallery_ranks):
+    number_of_ranks = probe_ranks.shape[1]
+    probe_ranks = probe_ranks.astype(np.float64)
+    gallery_ranks = gallery_ranks.astype(np.float64)
+    # distances from the centre only depend on one rank, hence they are computed once per list
+    probe_centre_terms = np.abs((probe_ranks / (number_of_ranks * 0.5)) - 1) ** wartmann_beta
+    gallery_centre_terms = np.abs((gallery_ranks / (number_of_ranks * 0.5)) - 1) ** wartmann_beta
+    # ranks and distances from the centre are passed side by side and split again within each tile
+    probe_matrix = np.hstack((probe_ranks, probe_centre_terms))
+    gallery_matrix = np.hstack((gallery_ranks, gallery_centre_terms))
+
+    def pair_function(probe_tile, gallery_tile):
+        rank_differences = np.abs(probe_tile[..., :number_of_ranks] - gallery_tile[..., :number_of_ranks])
+        centre_terms = probe_tile[..., number_of_ranks:] + gallery_tile[..., number_of_ranks:]
+        return np.sum(((rank_differences / number_of_ranks) ** wartmann_alpha) * centre_terms, axis=-1)
+
+    return -apply_pairwise(pair_function, probe_matrix, gallery_matrix)
+
+
+# compute correlations of all probe and gallery rank lists with the help of kendall's tau
+def kendall_matrix(probe_ranks, gallery_ranks):
+    return get_correlation_matrix(get_kendall_tau, probe_ranks, gallery_ranks)
+
+
+# compute correlations of all probe and gallery rank lists with the help of kendall's weighted tau
+# (same as scipy's weightedtau with additive hyperbolic weights ranked by both lists)
+def weighted_kendall_matrix(probe_ranks, gallery_ranks):
+    return get_correlation_matrix(get_weighted_kendall_tau, probe_ranks, gallery_ranks)
+
+
+# compute correlations of all probe and gallery rank lists with the help of spearman's formula
+def spearman_matrix(probe_ranks, gallery_ranks):
+    # rank lists are permutations, hence spearman's rho is the pearson correlation of the centered ranks
+    centered_probe_ranks = probe_ranks - np.mean(probe_ranks, axis=1, keepdims=True)
+    centered_gallery_ranks = gallery_ranks - np.mean(gallery_ranks, axis=1, keepdims=True)
+
+    return normalize_rows(centered_probe_ranks) @ normalize_rows(centered_gallery_ranks).T
+
+
 ####################################################
 #                                                  #
 #              Standardization Method              #
@@ -188,6 +289,42 @@ def sqeuclidean(probe_sample, gallery_sample):
     return -scipy.spatial.distance.sqeuclidean(probe_sample.standardized_distances, gallery_sample.standardized_distances)
 
 
+####################################################
+#                                                  #
+#           Batch Standardization Method           #
+#                                                  #
+####################################################
+
+# compute similarities of all probe and gallery lists with the help of braycurtis distance
+def braycurtis_matrix(probe_lists, gallery_lists):
+    return -distance_matrix(probe_lists, gallery_lists, "braycurtis")
+
+
+# compute similarities of all probe and gallery lists with the help of canberra distance
+def canberra_matrix(probe_lists, gallery_lists):
+    return -distance_matrix(probe_lists, gallery_lists, "canberra")
+
+
+# compute similarities of all probe and gallery lists with the help of cityblock distance
+def cityblock_matrix(probe_lists, gallery_lists):
+    return -distance_matrix(probe_lists, gallery_lists, "cityblock")
+
+
+# compute similarities of all probe and gallery lists with the help of cosine distance
+def cosine_matrix(probe_lists, gallery_lists):
+    return -distance_matrix(probe_lists, gallery_lists, "cosine")
+
+
+# compute similarities of all probe and gallery lists with the help of minkowski distance
+def minkowski_matrix(probe_lists, gallery_lists):
+    return -distance_matrix(probe_lists, gallery_lists, "minkowski", p=minkowski_p)
+
+
+# compute similarities of all probe and gallery lists with the help of sqeuclidean distance
+def sqeuclidean_matrix(probe_lists, gallery_lists):
+    return -distance_matrix(probe_lists, gallery_lists, "sqeuclidean")
+
+
 ####################################################
 #                                                  #
 #                  Helper Methods                  #
@@ -205,15 +342,175 @@ def get_similarity_scores(probe_sample, gallery_samples, comparison_function):
         # append the score to the list
         similarity_scores.append(similarity_score)
 
-        data = [probe_sample.reference_id, probe_sample.subject_id,
-                gallery_sample.reference_id, gallery_sample.subject_id,
-                similarity_score]
-        # save to external spreadsheet to determine VP
-        save_scores(data)
+    # save to external spreadsheet to determine VP
+    save_score_block([probe_sample], gallery_samples, [similarity_scores])
 
     return np.array(similarity_scores)
 
 
+# used to count for every element of each sequence (permutation of 0..n-1) the preceding greater elements
+def get_left_greater_counts(sequences):
+    number_of_sequences, length = sequences.shape
+    rows = np.arange(number_of_sequences)
+    # binary indexed tree per sequence, indices above the largest power of two are only used as sink
+    tree_size = 1 << int(length).bit_length()
+    tree = np.zeros((number_of_sequences, 2 * tree_size + 1), dtype=np.int32)
+    left_greater_counts = np.empty(sequences.shape, dtype=np.int64)
+
+    for position in range(length):
+        values = sequences[:, position].astype(np.int64) + 1
+        # count preceding elements which are smaller than the current one
+        index = values.copy()
+        smaller_counts = np.zeros(number_of_sequences, dtype=np.int64)
+        while index.any():
+            smaller_counts += tree[rows, index]
+            index -= index & -index
+        left_greater_counts[:, position] = position - smaller_counts
+        # insert current element
+        index = values
+        while (index <= tree_size).any():
+            tree[rows, index] += 1
+            index = np.minimum(index + (index & -index), 2 * tree_size)
+
+    return left_greater_counts
+
+
+# used to count for all probe and gallery rank lists how many discordant pairs every element takes part in
+def get_discordances(probe_ranks, gallery_ranks):
+    number_of_ranks = probe_ranks.shape[1]
+    # order gallery rank lists by the probe rank lists, hence the probe ranks become 0..n-1
+    orders = np.argsort(probe_ranks, axis=1)
+    ordered_ranks = gallery_ranks[:, orders].transpose(1, 0, 2).astype(np.int64)
+    left_greater_counts = get_left_greater_counts(
+        ordered_ranks.reshape(-1, number_of_ranks)
+    ).reshape(ordered_ranks.shape)
+    # preceding greater elements plus succeeding smaller elements
+    discordances = 2 * left_greater_counts + ordered_ranks - np.arange(number_of_ranks)
+
+    return ordered_ranks, discordances
+
+
+# used to compute kendall's tau from the discordances of pairs of rank lists
+def get_kendall_tau(ordered_ranks, discordances):
+    number_of_ranks = discordances.shape[-1]
+    # every discordant pair is counted for both of its elements
+    return 1 - (2 * np.sum(discordances, axis=-1)) / (number_of_ranks * (number_of_ranks - 1))
+
+
+# used to compute kendall's weighted tau from the discordances of pairs of rank lists
+def get_weighted_kendall_tau(ordered_ranks, discordances):
+    number_of_ranks = discordances.shape[-1]
+    # the highest rank is the most important one and is weighted by 1, the second highest by 1/2, ...
+    probe_weights = 1 / (number_of_ranks - np.arange(number_of_ranks))
+    total_weight = (number_of_ranks - 1) * np.sum(probe_weights)
+    gallery_weights = 1 / (number_of_ranks - ordered_ranks)
+    probe_tau = 1 - (2 * (discordances @ probe_weights)) / total_weight
+    gallery_tau = 1 - (2 * np.sum(gallery_weights * discordances, axis=-1)) / total_weight
+
+    return (probe_tau + gallery_tau) / 2
+
+
+# used to compute kendall-type correlations of blocks of probes and all gallery samples
+def get_correlation_matrix(tau_function, probe_ranks, gallery_ranks):
+    number_of_ranks = probe_ranks.shape[1]
+    scores = np.empty((len(probe_ranks), len(gallery_ranks)))
+    # ordered ranks, counts, discordances and tree per pair of rank lists
+    bytes_per_probe = len(gallery_ranks) * (5 * number_of_ranks + 1) * scores.itemsize
+    for block in get_blocks(len(probe_ranks), bytes_per_probe):
+        scores[block] = tau_function(*get_discordances(probe_ranks[block], gallery_ranks))
+
+    return scores
+
+
+# used to turn truncated rank lists (cohort indices ordered by rank) into a sparse matrix with one column per
+# cohort member, where every entry holds the weight of the rank at which the member is listed
+def get_truncated_weights(truncated_rank_lists, weights, number_of_columns):
+    number_of_rows, number_of_ranks = truncated_rank_lists.shape
+    return scipy.sparse.csr_matrix(
+        (np.tile(weights, number_of_rows), np.ravel(truncated_rank_lists),
+         np.arange(0, number_of_rows * number_of_ranks + 1, number_of_ranks)),
+        shape=(number_of_rows, number_of_columns)
+    )
+
+
+# used to sum the products of rank weights over all cohort members both truncated rank lists share
+def get_truncated_product(probe_ranks, gallery_ranks, weights):
+    number_of_columns = int(max(np.max(probe_ranks), np.max(gallery_ranks))) + 1
+    probe_weights = get_truncated_weights(probe_ranks, weights, number_of_columns)
+    gallery_weights = get_truncated_weights(gallery_ranks, weights, number_of_columns)
+
+    return (probe_weights @ gallery_weights.T).toarray()
+
+
+# used to bound the amount by which truncation lowers a mueller2013 score, every omitted cohort member has a rank
+# of at least the truncation in one of both lists, hence the omitted terms sum up to at most
+# 2 * lambda ** truncation * (1 - lambda ** (cohort_size - truncation)) / (1 - lambda)
+def get_mueller2013_truncation_bound(truncation, cohort_size):
+    if truncation >= cohort_size:
+        return 0.0
+    if mueller2013_lambda == 1:
+        return 2.0 * (cohort_size - truncation)
+
+    return 2 * mueller2013_lambda ** truncation * (1 - mueller2013_lambda ** (cohort_size - truncation)) / \
+        (1 - mueller2013_lambda)
+
+
+# used to stack features (baseline) or preprocessed lists of all samples into one matrix per sample set
+def get_comparison_matrices(probe_samples, gallery_samples, category):
+    if not category:
+        # features are normalized once for all cosine similarities and converted into the chosen precision
+        return prepare_embeddings(normalize_rows(stack_samples(probe_samples))), \
+            prepare_embeddings(normalize_rows(stack_samples(gallery_samples)))
+
+    if category == "rank-list-comparison":
+        return stack_rank_lists(probe_samples), stack_rank_lists(gallery_samples)
+
+    return stack_samples(probe_samples, "standardized_distances"), stack_samples(gallery_samples,
+                                                                                 "standardized_distances")
+
+
+# used to get the function computing the similarity scores of a block of probes and all gallery samples
+def get_matrix_function(comparison_method):
+    if comparison_method == "baseline":
+        return baseline
+
+    return eval(comparison_method + "_matrix")
+
+
+# used to get the current values of the parameters of a comparison method
+def get_method_parameters(comparison_method):
+    return {parameter: eval(parameter) for parameter in method_parameters.get(comparison_method, [])}
+
+
+# used to count positive matches of a block of probes given their similarity scores
+def get_block_matches(probe_samples, gallery_samples, scores):
+    positive_matches = 0
+    for probe_sample, max_score_index in zip(probe_samples, np.argmax(scores, axis=1)):
+        positive_matches += get_match_result(probe_sample, gallery_samples[max_score_index])
+
+    return positive_matches
+
+
+# used to get the k best gallery candidates of every probe with partial selection (ordered by decreasing score)
+def get_top_candidates(scores, k):
+    k = min(k, scores.shape[1])
+    # select the k best candidates without sorting the whole gallery, then sort only those
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+# used to get the rank of the best genuine gallery sample of every probe of a block, ranks are computed like in the
+# evaluation, hence the cmc of the top k candidates and the evaluated cmc report the same rates
+def get_block_ranks(probe_samples, gallery_samples, scores):
+    probe_subject_ids = np.array([sample.subject_id for sample in probe_samples])
+    gallery_subject_ids = np.array([sample.subject_id for sample in gallery_samples])
+
+    return get_genuine_ranks(probe_subject_ids[:, None] == gallery_subject_ids[None, :], scores)
+
+
 # used to see whether the correct gallery sample is paired with the current probe sample
 def get_match_result(probe_sample, gallery_sample):
     # return 1 for positive matches (if the subject_ids are the same)
@@ -229,36 +526,99 @@ def get_match_result(probe_sample, gallery_sample):
 #                                                  #
 ####################################################
 
+# used to score blocks of probes against the whole gallery at once, yields every block with its scores
+def get_score_blocks(matrix_function, probe_matrix, gallery_matrix, probe_samples, gallery_samples):
+    for block in get_blocks(len(probe_samples), len(gallery_samples) * np.dtype(np.float64).itemsize):
+        with span("scoring"):
+            result = matrix_function(probe_matrix[block], gallery_matrix)
+        yield block, result
+
+
+# used to read blocks of probes from a memory-mapped score matrix, yields every block with its scores
+def read_score_blocks(scores, probe_samples, gallery_samples):
+    for block in get_blocks(len(probe_samples), len(gallery_samples) * scores.itemsize):
+        yield block, np.asarray(scores[block])
+
+
+# used to count positive matches of all probes by scoring blocks of probes against the whole gallery at once
+# (or tile by tile into a memory-mapped score matrix if enabled and a protocol is given),
+# returns the positive matches and the top k candidates with their scores (None if top_k is zero)
+def compare_matrices(probe_matrix, gallery_matrix, probe_samples, gallery_samples, comparison_method, protocol=None):
+    matrix_function = get_matrix_function(comparison_method)
+    if score_matrix.score_matrix_enabled and protocol:
+        scores = score_tiles(comparison_method, get_method_parameters(comparison_method), matrix_function,
+                             probe_matrix, gallery_matrix, probe_samples, gallery_samples,
+                             get_score_matrix_directory(comparison_method, get_method_parameters(comparison_method),
+                                                        protocol, score_matrix.list_method,
+                                                        score_matrix.cohort_variant))
+        score_blocks = read_score_blocks(scores, probe_samples, gallery_samples)
+    else:
+        score_blocks = get_score_blocks(matrix_function, probe_matrix, gallery_matrix, probe_samples, gallery_samples)
+
+    return compare_blocks(score_blocks, probe_samples, gallery_samples)
+
+
+# used to count positive matches of all probes given the scores of blocks of probes against the whole gallery,
+# returns the positive matches and the top k candidates with their scores (None if top_k is zero)
+def compare_blocks(score_blocks, probe_samples, gallery_samples):
+    # used to keep track of positive matches (equal subject_id for probe and gallery sample)
+    positive_matches = 0
+    # used to keep track of the best candidates of every probe
+    candidate_blocks = []
+    candidate_score_blocks = []
+    rank_blocks = []
+
+    for block, result in score_blocks:
+        # save to external spreadsheet to determine VP
+        with span("output_writing"):
+            save_score_block(probe_samples[block], gallery_samples, result)
+        # find maximum score of every probe and compare IDs for IP
+        with span("argmax"):
+            positive_matches += get_block_matches(probe_samples[block], gallery_samples, result)
+        # collect scores for cmc, det and eer
+        add_evaluation_block(probe_samples[block], gallery_samples, result)
+        if top_k:
+            with span("top_k"):
+                candidates, candidate_scores = get_top_candidates(result, top_k)
+                rank_blocks.append(get_block_ranks(probe_samples[block], gallery_samples, result))
+            candidate_blocks.append(candidates)
+            candidate_score_blocks.append(candidate_scores)
+
+    if not top_k:
+        return positive_matches, None
+
+    # cumulative match characteristic (recognition rate of rank 1 to k)
+    return positive_matches, (np.vstack(candidate_blocks), np.vstack(candidate_score_blocks),
+                              get_cmc(np.concatenate(rank_blocks), len(gallery_samples))[:top_k])
+
+
 # used to run comparison with chosen method
 def run_comparison(probe_samples, gallery_samples, category, comparison_method, protocol, record_output):
     # used to record output
     file_creation(comparison_method, protocol, record_output)
-
-    # assign default function to variable for computation
-    comparison_function = eval(comparison_method)
-
-    # used to keep track of positive matches (equal subject_id for probe and gallery sample)
-    positive_matches = 0
+    create_evaluation()
 
     # used for measuring runtime
     start_time_cpu = time.process_time()
 
-    if not category:  # run baseline -> direct comparison
-        for probe_sample in probe_samples:
-            result = baseline(probe_sample, gallery_samples)
-            # find maximum score and compare IDs for IP
-            max_score_index = np.argmax(result)
-            positive_matches += get_match_result(probe_sample, gallery_samples[max_score_index])
-    else:  # makes use of preprocessed rank/standardized lists
-        for probe_sample in probe_samples:
-            result = get_similarity_scores(probe_sample, gallery_samples, comparison_function)
-            # find maximum score and compare IDs for IP
-            max_score_index = np.argmax(result)
-            positive_matches += get_match_result(probe_sample, gallery_samples[max_score_index])
-
-    # stop runtime measurement
+    probe_matrix, gallery_matrix = get_comparison_matrices(probe_samples, gallery_samples, category)
+    positive_matches, shortlist = compare_matrices(probe_matrix, gallery_matrix, probe_samples, gallery_samples,
+                                                   comparison_method, protocol)
+
+    # stop runtime measurement, collecting the scores for the evaluation is not part of the comparison and tiles
+    # of a resumed score matrix count with the time of the run that scored them
     stop_time_cpu = time.process_time()
-    runtime = stop_time_cpu - start_time_cpu
+    runtime = stop_time_cpu - start_time_cpu - get_evaluation_runtime() + get_resumed_runtime()
+
+    # save the best candidates of every probe and the cumulative match characteristic
+    if shortlist and record_output:
+        with span("output_writing"):
+            save_shortlist(comparison_method, protocol, probe_samples, gallery_samples, *shortlist)
+
+    # save cmc, det and eer computed from the collected scores (if evaluation is enabled)
+    evaluation_results = finish_evaluation()
+    with span("output_writing"):
+        save_evaluation(comparison_method, protocol, evaluation_results)
 
     # calculate recognition rate by dividing positive matches by total amount of probes
     recognition_rate = positive_matches / len(probe_samples)
@@ -266,5 +626,6 @@ def run_comparison(probe_samples, gallery_samples, category, comparison_method,
     # save recognition rate and runtime before closing files
     if record_output:
         recognition_rate = "{:.2f}".format(recognition_rate * 100)
-        save_results(comparison_method, protocol, recognition_rate, runtime)
-        close_files()
+        with span("output_writing"):
+            save_results(comparison_method, protocol, recognition_rate, runtime)
+            close_files()
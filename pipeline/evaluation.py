@@ -0,0 +1,242 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import csv
+import numpy as np
+import pathlib
+import time
+
+
+####################################################
+#                                                  #
+#                    Data Class                    #
+#                                                  #
+####################################################
+
+class ScoreStatistics:
+    def __init__(self):
+        self.genuine_ranks = []
+        self.genuine_blocks = []
+        self.impostor_blocks = []
+        self.number_of_gallery_samples = 0
+        # cpu time spent collecting the scores, hence it can be left out of the runtime of the comparison
+        self.runtime = 0.0
+
+    def add_block(self, probe_samples, gallery_samples, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        probe_subject_ids = np.array([sample.subject_id for sample in probe_samples])
+        gallery_subject_ids = np.array([sample.subject_id for sample in gallery_samples])
+        genuine = probe_subject_ids[:, None] == gallery_subject_ids[None, :]
+        self.number_of_gallery_samples = len(gallery_samples)
+
+        self.genuine_ranks.append(get_genuine_ranks(genuine, scores))
+        self.genuine_blocks.append(scores[genuine])
+        self.impostor_blocks.append(scores[~genuine])
+
+    def get_results(self):
+        genuine_ranks = np.concatenate(self.genuine_ranks)
+        genuine_scores = np.sort(np.concatenate(self.genuine_blocks))
+        impostor_scores = np.sort(np.concatenate(self.impostor_blocks))
+
+        cmc = get_cmc(genuine_ranks, self.number_of_gallery_samples)
+        thresholds, fmr, fnmr = get_error_rates(genuine_scores, impostor_scores)
+        eer_index = np.argmin(np.abs(fmr - fnmr))
+
+        return {
+            "cmc": cmc,
+            "det": get_curve_points(thresholds, fmr, fnmr),
+            "eer": (fmr[eer_index] + fnmr[eer_index]) / 2,
+            "eer_threshold": thresholds[eer_index],
+            "fnmr_at_fmr": [get_fnmr_at_fmr(fmr, fnmr, target) for target in fmr_targets],
+            "thresholds": [(threshold, *get_rates_at_threshold(genuine_scores, impostor_scores, threshold))
+                           for threshold in evaluation_thresholds],
+        }
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# evaluation is only computed if enabled
+evaluation_enabled = False
+# thresholds at which fmr and fnmr are reported
+evaluation_thresholds = []
+# false match rates at which the false non-match rate is reported
+fmr_targets = [0.1, 0.01, 0.001]
+# ranks of the cmc reported in the summary
+summary_ranks = [1, 5, 10]
+# upper bound for the number of points of a saved det curve
+curve_points = 500
+current_statistics = None
+
+
+# setter for evaluation_enabled
+def set_evaluation_enabled(value):
+    global evaluation_enabled
+    evaluation_enabled = value
+
+
+# setter for evaluation_thresholds
+def set_evaluation_thresholds(value):
+    global evaluation_thresholds
+    evaluation_thresholds = value or []
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to get the rank of every probe, which is one plus the number of gallery samples scoring above its best genuine
+# score (ties count for the genuine sample), probes without genuine gallery sample get rank zero (never recognized)
+def get_genuine_ranks(genuine, scores):
+    best_genuine_scores = np.where(genuine, scores, -np.inf).max(axis=1)
+    ranks = 1 + np.sum(scores > best_genuine_scores[:, None], axis=1)
+    ranks[~genuine.any(axis=1)] = 0
+
+    return ranks
+
+
+# used to calculate the cumulative match characteristic (recognition rate of every rank) from the genuine ranks
+def get_cmc(genuine_ranks, number_of_gallery_samples):
+    rank_counts = np.bincount(genuine_ranks[genuine_ranks > 0], minlength=number_of_gallery_samples + 1)[1:]
+
+    return np.cumsum(rank_counts) / len(genuine_ranks)
+
+
+# used to calculate fmr and fnmr at every distinct score with cumulative counts over the sorted scores,
+# scores greater than or equal to the threshold are accepted
+def get_error_rates(genuine_scores, impostor_scores):
+    scores = np.concatenate([genuine_scores, impostor_scores])
+    is_genuine = np.concatenate([np.ones(len(genuine_scores), dtype=bool), np.zeros(len(impostor_scores), dtype=bool)])
+    order = np.argsort(scores, kind="stable")
+    thresholds, first_indices = np.unique(scores[order], return_index=True)
+
+    # number of genuine and impostor scores below every threshold
+    genuine_below = np.concatenate([[0], np.cumsum(is_genuine[order])])[first_indices]
+    impostor_below = first_indices - genuine_below
+    fnmr = genuine_below / max(len(genuine_scores), 1)
+    fmr = (len(impostor_scores) - impostor_below) / max(len(impostor_scores), 1)
+
+    return thresholds, fmr, fnmr
+
+
+# used to get fmr and fnmr at a single threshold from the sorted genuine and impostor scores
+def get_rates_at_threshold(genuine_scores, impostor_scores, threshold):
+    fnmr = np.searchsorted(genuine_scores, threshold, side="left") / max(len(genuine_scores), 1)
+    fmr = 1 - np.searchsorted(impostor_scores, threshold, side="left") / max(len(impostor_scores), 1)
+
+    return fmr, fnmr
+
+
+# used to get the lowest fnmr among all thresholds whose fmr does not exceed the target
+def get_fnmr_at_fmr(fmr, fnmr, target):
+    accepted = fmr <= target
+    if not accepted.any():
+        return 1.0
+
+    return fnmr[accepted].min()
+
+
+# used to reduce the det curve to evenly spaced points (both end points are always kept)
+def get_curve_points(thresholds, fmr, fnmr):
+    indices = np.unique(np.linspace(0, len(thresholds) - 1, min(len(thresholds), curve_points)).astype(int))
+
+    return np.column_stack([thresholds[indices], fmr[indices], fnmr[indices]])
+
+
+# used to turn a rate into a percentage string
+def round_rate(rate):
+    return "{:.2f}".format(rate * 100)
+
+
+####################################################
+#                                                  #
+#                   File Writing                   #
+#                                                  #
+####################################################
+
+# used to start collecting the scores of a comparison method (nothing is collected if disabled)
+def create_evaluation():
+    global current_statistics
+    current_statistics = ScoreStatistics() if evaluation_enabled else None
+
+
+# used to collect a block of similarity scores (one row per probe sample, one column per gallery sample)
+def add_evaluation_block(probe_samples, gallery_samples, scores):
+    if current_statistics:
+        start_time_cpu = time.process_time()
+        current_statistics.add_block(probe_samples, gallery_samples, scores)
+        current_statistics.runtime += time.process_time() - start_time_cpu
+
+
+# used to get the cpu time spent collecting the scores of the current comparison method (zero if disabled)
+def get_evaluation_runtime():
+    return current_statistics.runtime if current_statistics else 0.0
+
+
+# used to compute the evaluation of all collected scores, returns None if nothing was collected
+def finish_evaluation():
+    global current_statistics
+    if not current_statistics or not current_statistics.genuine_ranks:
+        current_statistics = None
+        return None
+
+    results = current_statistics.get_results()
+    current_statistics = None
+
+    return results
+
+
+# used to append a row to a csv file shared by all comparison methods (header is added to new files)
+def append_rows(filename, header, rows):
+    file = pathlib.Path(filename)
+    add_header = not file.is_file()
+    with open(file, 'a', newline='') as evaluation_dev:
+        evaluation_writer = csv.writer(evaluation_dev)
+        if add_header:
+            evaluation_writer.writerow(header)
+        evaluation_writer.writerows(rows)
+
+
+# used to save the evaluation next to the recognition rates (summary, det curve, cmc and rates at thresholds)
+def save_evaluation(comparison_method, protocol, results):
+    if not results:
+        return
+
+    # create output directory
+    pathlib.Path("output").mkdir(exist_ok=True)
+
+    cmc = results["cmc"]
+    append_rows("output/evaluation.csv",
+                ['comparison_method', 'protocol', 'eer (%)', 'eer_threshold'] +
+                ['fnmr@fmr=%g%% (%%)' % (target * 100) for target in fmr_targets] +
+                ['rank-%d_recog_rate (%%)' % rank for rank in summary_ranks],
+                [[comparison_method, protocol, round_rate(results["eer"]), "{:.6g}".format(results["eer_threshold"])] +
+                 [round_rate(fnmr) for fnmr in results["fnmr_at_fmr"]] +
+                 [round_rate(cmc[min(rank, len(cmc)) - 1]) for rank in summary_ranks]])
+
+    if results["thresholds"]:
+        append_rows("output/evaluation-thresholds.csv",
+                    ['comparison_method', 'protocol', 'threshold', 'fmr (%)', 'fnmr (%)'],
+                    [[comparison_method, protocol, "{:g}".format(threshold), round_rate(fmr), round_rate(fnmr)]
+                     for threshold, fmr, fnmr in results["thresholds"]])
+
+    # filename consists of protocol and comparison method (e.g. close-baseline-det.csv)
+    with open("output/" + protocol + "-" + comparison_method + "-det.csv", 'w', newline='') as det_dev:
+        det_writer = csv.writer(det_dev)
+        det_writer.writerow(['threshold', 'fmr', 'fnmr'])
+        det_writer.writerows(["{:.6g}".format(value) for value in point] for point in results["det"])
+
+    # cmc is saved up to the rank at which its final rate is reached
+    last_rank = int(np.argmax(cmc == cmc[-1])) + 1
+    with open("output/" + protocol + "-" + comparison_method + "-cmc.csv", 'w', newline='') as cmc_dev:
+        cmc_writer = csv.writer(cmc_dev)
+        cmc_writer.writerow(['rank', 'recog_rate (%)'])
+        cmc_writer.writerows([rank + 1, round_rate(rate)] for rank, rate in enumerate(cmc[:last_rank]))
@@ -0,0 +1,114 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import json
+import numpy as np
+import pathlib
+import threading
+from helpers.colors import Colors
+
+
+####################################################
+#                                                  #
+#                 Path Declaration                 #
+#                                                  #
+####################################################
+
+# features are extracted to the source directory and packed into the store directory
+file_path = str(pathlib.Path().resolve())
+source_directory_path = file_path + "/samples_pipe_all/samplewrapper-2/"
+store_directory_path = file_path + "/samples_pipe_all/feature-store/"
+
+# contiguous array with one row per sample and index mapping each sample key to its row
+features_filename = "features.npy"
+index_filename = "index.json"
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# memory-mapped features and key index (loaded once on first access)
+store_features = None
+store_index = None
+# features are requested by several loading workers at once
+store_lock = threading.Lock()
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to collect the keys of all feature files (relative path without file extension)
+def get_source_keys(source_directory):
+    source_directory = pathlib.Path(source_directory)
+    return sorted(str(path.relative_to(source_directory))[:-len(".h5")] for path in source_directory.rglob("*.h5"))
+
+
+# used to pack all feature files into one contiguous array file plus an index of sample keys
+def build_feature_store(source_directory=source_directory_path, store_directory=store_directory_path):
+    global store_features
+    global store_index
+
+    # bob is imported on first use, hence stored features can be read without it
+    import bob.io.base
+
+    keys = get_source_keys(source_directory)
+    if not keys:
+        print(f"{Colors.BOLD}{Colors.CRED}WARNING:{Colors.ENDC} No feature files found in '%s'!" % source_directory)
+        return
+
+    source_directory = pathlib.Path(source_directory)
+    store_directory = pathlib.Path(store_directory)
+    store_directory.mkdir(parents=True, exist_ok=True)
+    # release a previously opened store before overwriting it
+    store_features = None
+    store_index = None
+
+    # the first file defines the shape of all rows
+    first_features = np.ravel(bob.io.base.load(str(source_directory / (keys[0] + ".h5"))))
+    features = np.lib.format.open_memmap(str(store_directory / features_filename), mode="w+",
+                                         dtype=first_features.dtype, shape=(len(keys), len(first_features)))
+    features[0] = first_features
+    for row, key in enumerate(keys[1:], start=1):
+        features[row] = np.ravel(bob.io.base.load(str(source_directory / (key + ".h5"))))
+    features.flush()
+    del features
+
+    with open(store_directory / index_filename, "w") as index_file:
+        json.dump({key: row for row, key in enumerate(keys)}, index_file)
+
+    print(f"{Colors.BOLD}INFO: {Colors.ENDC}Packed %d feature files into '%s'" % (len(keys), store_directory))
+
+
+# used to open the feature store as memory map, returns False if it has not been built
+def open_feature_store(store_directory=store_directory_path):
+    global store_features
+    global store_index
+
+    with store_lock:
+        if store_index is None:
+            store_directory = pathlib.Path(store_directory)
+            # remember a missing store as empty index to avoid checking the files again for every sample
+            store_index = {}
+            if (store_directory / features_filename).is_file() and (store_directory / index_filename).is_file():
+                store_features = np.load(str(store_directory / features_filename), mmap_mode="r")
+                with open(store_directory / index_filename) as index_file:
+                    store_index = json.load(index_file)
+
+    return store_features is not None
+
+
+# used to get the features of a sample key as zero-copy view, returns None if the key is not stored
+def get_stored_features(key):
+    if not open_feature_store() or key not in store_index:
+        return None
+
+    return store_features[store_index[key]]
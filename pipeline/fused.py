@@ -0,0 +1,312 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import numpy as np
+import pipeline.comparison as comparison
+import pipeline.evaluation as evaluation
+import time
+from helpers.categories import get_category
+from helpers.colors import Colors
+from helpers.file_writing import new_score_sink, flush_score_sink, open_recognition_file, reset_recognition, \
+    save_shortlist, save_results, close_files, set_preprocess_time, get_preprocess_time
+from helpers.profiling import span
+from pipeline.comparison import baseline, mueller2013_matrix, schroff_matrix, cosine_matrix, get_discordances, \
+    get_kendall_tau, get_weighted_kendall_tau, get_comparison_matrices, get_block_matches, get_top_candidates, \
+    get_block_ranks
+from pipeline.evaluation import ScoreStatistics, save_evaluation, get_cmc
+from pipeline.matrices import get_blocks, normalize_rows
+from pipeline.preprocessing import run_preprocessing, get_preprocess_method
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# intermediates shared by several measures (computed in this order, later ones may use earlier ones)
+# with the number of arrays of shape (probes, gallery, list length) they hold
+fused_intermediates = {
+    "float_ranks": 0,
+    "rank_sums": 1,
+    "rank_differences": 1,
+    "centered_ranks": 0,
+    "discordances": 5,
+    "absolute_differences": 1,
+}
+
+# intermediates every measure derives its scores from
+fused_measures = {
+    "baseline": [],
+    "mueller2010": ["float_ranks", "rank_sums"],
+    "schroff": [],
+    "mueller2013": [],
+    "wartmann": ["float_ranks", "rank_differences"],
+    "spearman": ["float_ranks", "centered_ranks"],
+    "kendall": ["discordances"],
+    "weighted_kendall": ["discordances"],
+    "cosine": [],
+    "braycurtis": ["absolute_differences"],
+    "canberra": ["absolute_differences"],
+    "cityblock": ["absolute_differences"],
+    "sqeuclidean": ["absolute_differences"],
+    "minkowski": ["absolute_differences"],
+}
+
+
+####################################################
+#                                                  #
+#                  Intermediates                   #
+#                                                  #
+####################################################
+
+# rank lists as floating point numbers
+def compute_float_ranks(probe_block, gallery_matrix, intermediates):
+    return probe_block.astype(np.float64), gallery_matrix.astype(np.float64)
+
+
+# sums of the ranks of all pairs
+def compute_rank_sums(probe_block, gallery_matrix, intermediates):
+    probe_ranks, gallery_ranks = intermediates["float_ranks"]
+    return probe_ranks[:, None, :] + gallery_ranks[None, :, :]
+
+
+# absolute differences of the ranks of all pairs relative to the number of ranks
+def compute_rank_differences(probe_block, gallery_matrix, intermediates):
+    probe_ranks, gallery_ranks = intermediates["float_ranks"]
+    return np.abs(probe_ranks[:, None, :] - gallery_ranks[None, :, :]) / probe_ranks.shape[1]
+
+
+# centered rank lists scaled to unit length
+def compute_centered_ranks(probe_block, gallery_matrix, intermediates):
+    probe_ranks, gallery_ranks = intermediates["float_ranks"]
+    return normalize_rows(probe_ranks - np.mean(probe_ranks, axis=1, keepdims=True)), \
+        normalize_rows(gallery_ranks - np.mean(gallery_ranks, axis=1, keepdims=True))
+
+
+# ordered gallery ranks and discordances of all pairs
+def compute_discordances(probe_block, gallery_matrix, intermediates):
+    return get_discordances(probe_block, gallery_matrix)
+
+
+# absolute differences of the lists of all pairs
+def compute_absolute_differences(probe_block, gallery_matrix, intermediates):
+    return np.abs(probe_block[:, None, :] - gallery_matrix[None, :, :])
+
+
+####################################################
+#                                                  #
+#                 Fused Measures                   #
+#                                                  #
+####################################################
+
+def fused_baseline(probe_block, gallery_matrix, intermediates):
+    return baseline(probe_block, gallery_matrix)
+
+
+def fused_mueller2010(probe_block, gallery_matrix, intermediates):
+    return np.sum(1 / np.sqrt(intermediates["rank_sums"] + 1), axis=-1)
+
+
+def fused_schroff(probe_block, gallery_matrix, intermediates):
+    return schroff_matrix(probe_block, gallery_matrix)
+
+
+def fused_mueller2013(probe_block, gallery_matrix, intermediates):
+    return mueller2013_matrix(probe_block, gallery_matrix)
+
+
+def fused_wartmann(probe_block, gallery_matrix, intermediates):
+    probe_ranks, gallery_ranks = intermediates["float_ranks"]
+    number_of_ranks = probe_ranks.shape[1]
+    probe_centre_terms = np.abs((probe_ranks / (number_of_ranks * 0.5)) - 1) ** comparison.wartmann_beta
+    gallery_centre_terms = np.abs((gallery_ranks / (number_of_ranks * 0.5)) - 1) ** comparison.wartmann_beta
+    powered_differences = intermediates["rank_differences"] ** comparison.wartmann_alpha
+
+    return -(np.einsum("pgc,pc->pg", powered_differences, probe_centre_terms) +
+             np.einsum("pgc,gc->pg", powered_differences, gallery_centre_terms))
+
+
+def fused_spearman(probe_block, gallery_matrix, intermediates):
+    centered_probe_ranks, centered_gallery_ranks = intermediates["centered_ranks"]
+    return centered_probe_ranks @ centered_gallery_ranks.T
+
+
+def fused_kendall(probe_block, gallery_matrix, intermediates):
+    return get_kendall_tau(*intermediates["discordances"])
+
+
+def fused_weighted_kendall(probe_block, gallery_matrix, intermediates):
+    return get_weighted_kendall_tau(*intermediates["discordances"])
+
+
+def fused_cosine(probe_block, gallery_matrix, intermediates):
+    return cosine_matrix(probe_block, gallery_matrix)
+
+
+def fused_braycurtis(probe_block, gallery_matrix, intermediates):
+    absolute_sums = np.abs(probe_block[:, None, :] + gallery_matrix[None, :, :])
+    return -np.sum(intermediates["absolute_differences"], axis=-1) / np.sum(absolute_sums, axis=-1)
+
+
+def fused_canberra(probe_block, gallery_matrix, intermediates):
+    denominators = np.abs(probe_block)[:, None, :] + np.abs(gallery_matrix)[None, :, :]
+    # terms with both elements zero are omitted (as in scipy)
+    quotients = np.divide(intermediates["absolute_differences"], denominators,
+                          out=np.zeros_like(denominators), where=denominators != 0)
+    return -np.sum(quotients, axis=-1)
+
+
+def fused_cityblock(probe_block, gallery_matrix, intermediates):
+    return -np.sum(intermediates["absolute_differences"], axis=-1)
+
+
+def fused_sqeuclidean(probe_block, gallery_matrix, intermediates):
+    absolute_differences = intermediates["absolute_differences"]
+    return -np.sum(absolute_differences * absolute_differences, axis=-1)
+
+
+def fused_minkowski(probe_block, gallery_matrix, intermediates):
+    return -np.sum(intermediates["absolute_differences"] ** comparison.minkowski_p, axis=-1) ** \
+        (1 / comparison.minkowski_p)
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to get the intermediates needed by the chosen measures in the order they are computed
+def get_needed_intermediates(comparison_methods):
+    return [name for name in fused_intermediates
+            if any(name in fused_measures[comparison_method] for comparison_method in comparison_methods)]
+
+
+# used to estimate the bytes per probe of a block (intermediates plus temporaries of the measures)
+def get_bytes_per_probe(intermediate_names, gallery_matrix):
+    number_of_arrays = sum(fused_intermediates[name] for name in intermediate_names) + 2
+    return len(gallery_matrix) * max(gallery_matrix.shape[1], 1) * number_of_arrays * np.dtype(np.float64).itemsize
+
+
+####################################################
+#                                                  #
+#                    Algorithm                     #
+#                                                  #
+####################################################
+
+# used to score all chosen measures of a category in one pass over blocks of probes, where every intermediate is
+# computed once per block and its runtime is split equally among the measures using it,
+# returns positive matches and runtime per measure
+def compare_fused(comparison_methods, probe_matrix, gallery_matrix, probe_samples, gallery_samples, protocol,
+                  record_output):
+    positive_matches = dict.fromkeys(comparison_methods, 0)
+    runtimes = dict.fromkeys(comparison_methods, 0.0)
+    candidates = {comparison_method: ([], [], []) for comparison_method in comparison_methods}
+    score_sinks = {comparison_method: new_score_sink(comparison_method, protocol)
+                   for comparison_method in comparison_methods} if record_output else {}
+    score_statistics = {comparison_method: ScoreStatistics()
+                        for comparison_method in comparison_methods} if evaluation.evaluation_enabled else {}
+
+    intermediate_names = get_needed_intermediates(comparison_methods)
+    for block in get_blocks(len(probe_samples), get_bytes_per_probe(intermediate_names, gallery_matrix)):
+        probe_block = probe_matrix[block]
+        intermediates = {}
+        for name in intermediate_names:
+            consumers = [comparison_method for comparison_method in comparison_methods
+                         if name in fused_measures[comparison_method]]
+            start_time_cpu = time.process_time()
+            with span("scoring"):
+                intermediates[name] = eval("compute_" + name)(probe_block, gallery_matrix, intermediates)
+            for consumer in consumers:
+                runtimes[consumer] += (time.process_time() - start_time_cpu) / len(consumers)
+
+        for comparison_method in comparison_methods:
+            start_time_cpu = time.process_time()
+            with span("scoring"):
+                result = eval("fused_" + comparison_method)(probe_block, gallery_matrix, intermediates)
+            with span("argmax"):
+                positive_matches[comparison_method] += get_block_matches(probe_samples[block], gallery_samples,
+                                                                         result)
+            if comparison.top_k:
+                block_candidates, block_candidate_scores = get_top_candidates(result, comparison.top_k)
+                candidates[comparison_method][0].append(block_candidates)
+                candidates[comparison_method][1].append(block_candidate_scores)
+                candidates[comparison_method][2].append(get_block_ranks(probe_samples[block], gallery_samples, result))
+            runtimes[comparison_method] += time.process_time() - start_time_cpu
+
+            # recording and evaluation of the scores are not part of the runtime of the measure
+            if score_sinks:
+                with span("output_writing"):
+                    score_sinks[comparison_method].add_block(probe_samples[block], gallery_samples, result)
+            if score_statistics:
+                score_statistics[comparison_method].add_block(probe_samples[block], gallery_samples, result)
+
+    for comparison_method in comparison_methods:
+        if record_output:
+            with span("output_writing"):
+                flush_score_sink(score_sinks[comparison_method])
+            if comparison.top_k:
+                cmc = get_cmc(np.concatenate(candidates[comparison_method][2]), len(gallery_samples))[:comparison.top_k]
+                with span("output_writing"):
+                    save_shortlist(comparison_method, protocol, probe_samples, gallery_samples,
+                                   np.vstack(candidates[comparison_method][0]),
+                                   np.vstack(candidates[comparison_method][1]), cmc)
+        if score_statistics:
+            evaluation_results = score_statistics[comparison_method].get_results()
+            with span("output_writing"):
+                save_evaluation(comparison_method, protocol, evaluation_results)
+
+    return positive_matches, runtimes
+
+
+# used to run all chosen measures of a category with a single preprocessing and a single pass per protocol
+def run_fused(comparison_methods, protocols, standardization_method, enable_larger_cohort, record_output):
+    categories = []
+    for comparison_method in comparison_methods:
+        if get_category(comparison_method) not in categories:
+            categories.append(get_category(comparison_method))
+
+    results = {}
+    preprocess_times = {}
+    for category in categories:
+        category_methods = [comparison_method for comparison_method in comparison_methods
+                            if get_category(comparison_method) == category]
+        for protocol in protocols:
+            with span("preprocessing"):
+                probe_samples, gallery_samples = run_preprocessing(
+                    category, protocol, standardization_method, enable_larger_cohort
+                )
+            preprocess_times[category, protocol] = get_preprocess_time(protocol)
+
+            # stacking the lists is attributed to all measures equally
+            start_time_cpu = time.process_time()
+            probe_matrix, gallery_matrix = get_comparison_matrices(probe_samples, gallery_samples, category)
+            stacking_time = (time.process_time() - start_time_cpu) / len(category_methods)
+
+            with span("comparison"):
+                positive_matches, runtimes = compare_fused(category_methods, probe_matrix, gallery_matrix,
+                                                           probe_samples, gallery_samples, protocol, record_output)
+            for comparison_method in category_methods:
+                recognition_rate = "{:.2f}".format(positive_matches[comparison_method] / len(probe_samples) * 100)
+                results[comparison_method, protocol] = (recognition_rate,
+                                                        runtimes[comparison_method] + stacking_time)
+                print(f"{Colors.BOLD}INFO: {Colors.ENDC}Finished {Colors.BOLD}{Colors.CRED}" + comparison_method +
+                      f"{Colors.ENDC} with protocol {Colors.CCYAN}" + protocol + f"{Colors.ENDC}: " +
+                      recognition_rate + "%")
+
+    # rows of the recognition file are written per comparison method in the order of the protocols
+    if record_output:
+        open_recognition_file()
+        reset_recognition()
+        for comparison_method in comparison_methods:
+            category = get_category(comparison_method)
+            for protocol in protocols:
+                set_preprocess_time(get_preprocess_method(category, standardization_method), protocol,
+                                    preprocess_times[category, protocol])
+                save_results(comparison_method, protocol, *results[comparison_method, protocol])
+        with span("output_writing"):
+            close_files()
@@ -0,0 +1,170 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import csv
+import itertools
+import numpy as np
+import pathlib
+from helpers.categories import get_category
+from helpers.colors import Colors
+from pipeline.comparison import get_method_parameters
+from pipeline.matrices import get_blocks
+from pipeline.preprocessing import get_list_method
+from pipeline.score_matrix import get_score_matrix_directory, get_cohort_variant, is_score_matrix_complete, \
+    load_score_matrix
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# normalizations applied to every stored score matrix before the weighted sum
+available_normalizations = ["znorm", "minmax", "rank"]
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to get the statistics a normalization needs from the whole score matrix (read in blocks of probes)
+def get_normalization_statistics(scores, normalization):
+    if normalization == "rank":
+        return None
+
+    count = 0
+    score_sum = 0.0
+    squared_sum = 0.0
+    minimum = np.inf
+    maximum = -np.inf
+    for block in get_blocks(len(scores), scores.shape[1] * scores.itemsize):
+        block_scores = np.asarray(scores[block])
+        count += block_scores.size
+        score_sum += np.sum(block_scores)
+        squared_sum += np.sum(block_scores ** 2)
+        minimum = min(minimum, np.min(block_scores))
+        maximum = max(maximum, np.max(block_scores))
+
+    if normalization == "znorm":
+        mean = score_sum / count
+        return mean, np.sqrt(max(squared_sum / count - mean ** 2, 0)) or 1
+
+    return minimum, (maximum - minimum) or 1
+
+
+# used to normalize the scores of a block of probes, z-norm and min-max use the statistics of the whole matrix,
+# rank-based normalization replaces every score by its rank among the gallery scores of the probe (scaled to [0, 1])
+def normalize_block(block_scores, normalization, statistics):
+    if normalization == "rank":
+        ranks = np.argsort(np.argsort(block_scores, axis=1), axis=1)
+        return ranks / max(block_scores.shape[1] - 1, 1)
+
+    # subtract mean (or minimum) and divide by standard deviation (or range)
+    return (block_scores - statistics[0]) / statistics[1]
+
+
+# used to get every combination of the weights for the score matrices (all weights zero is left out)
+def get_weight_grid(weights, number_of_matrices):
+    weight_grid = np.array(list(itertools.product(weights, repeat=number_of_matrices)), dtype=np.float64)
+
+    return weight_grid[np.any(weight_grid != 0, axis=1)]
+
+
+# used to get the stored score matrix of every fused comparison method with the current lists and parameters
+def get_fusion_directories(fusion_methods, protocol, standardization_method, enable_larger_cohort):
+    return [get_score_matrix_directory(fusion_method, get_method_parameters(fusion_method), protocol,
+                                       get_list_method(get_category(fusion_method), standardization_method),
+                                       get_cohort_variant(get_category(fusion_method), enable_larger_cohort))
+            for fusion_method in fusion_methods]
+
+
+# used to terminate if a score matrix is missing or if the matrices do not hold the same probes and gallery samples
+def check_score_matrices(directories, stored_matrices):
+    missing_directories = [str(directory) for directory in directories if not is_score_matrix_complete(directory)]
+    if missing_directories:
+        print(f"\n{Colors.BOLD}{Colors.CRED}WARNING:{Colors.ENDC} %d score matrix/matrices not stored, " %
+              len(missing_directories) + "run the comparison methods with --score_matrix first:\n" +
+              "\n".join(missing_directories) +
+              f"\n\n{Colors.BOLD}{Colors.CRED}PROCESS TERMINATED{Colors.ENDC}")
+        exit()
+
+    if stored_matrices and any(rows != stored_matrices[0][1] or columns != stored_matrices[0][2]
+                               for _, rows, columns in stored_matrices[1:]):
+        print(f"\n{Colors.BOLD}{Colors.CRED}WARNING:{Colors.ENDC} Stored score matrices differ in probes or gallery!" +
+              f"\n\n{Colors.BOLD}{Colors.CRED}PROCESS TERMINATED{Colors.ENDC}")
+        exit()
+
+
+# used to save the recognition rate of every normalization and combination of weights
+def save_fusion(fusion_methods, protocol, fusion_results):
+    # create output directory
+    pathlib.Path("output").mkdir(exist_ok=True)
+
+    filename = "output/fusion-" + protocol + "-" + "-".join(fusion_methods) + ".csv"
+    with open(filename, 'w', newline='') as fusion_dev:
+        fusion_writer = csv.writer(fusion_dev)
+        fusion_writer.writerow(['normalization'] + ['weight_' + fusion_method for fusion_method in fusion_methods] +
+                               ['recog_rate (%)'])
+        fusion_writer.writerows(fusion_results)
+
+
+####################################################
+#                                                  #
+#                    Algorithm                     #
+#                                                  #
+####################################################
+
+# used to get the recognition rate (in percent) of every combination of weights, where blocks of probes are
+# normalized once and all weighted sums of a block are computed at once
+def fuse_scores(score_matrices, normalization, weight_grid, probe_subject_ids, gallery_subject_ids):
+    statistics = [get_normalization_statistics(scores, normalization) for scores in score_matrices]
+    positive_matches = np.zeros(len(weight_grid), dtype=np.int64)
+
+    bytes_per_probe = (len(score_matrices) + len(weight_grid)) * len(gallery_subject_ids) * \
+        np.dtype(np.float64).itemsize
+    for block in get_blocks(len(probe_subject_ids), bytes_per_probe):
+        normalized_scores = np.stack([normalize_block(np.asarray(scores[block]), normalization, matrix_statistics)
+                                      for scores, matrix_statistics in zip(score_matrices, statistics)])
+        # weighted sums of all combinations with shape (combinations, probes, gallery)
+        fused_scores = np.tensordot(weight_grid, normalized_scores, axes=1)
+        best_candidates = np.argmax(fused_scores, axis=2)
+        positive_matches += np.sum(gallery_subject_ids[best_candidates] == probe_subject_ids[block], axis=1)
+
+    return positive_matches / len(probe_subject_ids) * 100
+
+
+# used to fuse the stored score matrices of the chosen comparison methods with every normalization and
+# combination of weights, nothing is recomputed
+def run_fusion(fusion_methods, protocols, standardization_method, enable_larger_cohort, normalizations, weights):
+    weight_grid = get_weight_grid(weights, len(fusion_methods))
+    for protocol in protocols:
+        directories = get_fusion_directories(fusion_methods, protocol, standardization_method, enable_larger_cohort)
+        check_score_matrices(directories, [])
+        stored_matrices = [load_score_matrix(directory) for directory in directories]
+        check_score_matrices(directories, stored_matrices)
+
+        score_matrices = [scores for scores, _, _ in stored_matrices]
+        probe_subject_ids = np.array(stored_matrices[0][1]["subject_ids"])
+        gallery_subject_ids = np.array(stored_matrices[0][2]["subject_ids"])
+
+        fusion_results = []
+        for normalization in normalizations:
+            recognition_rates = fuse_scores(score_matrices, normalization, weight_grid, probe_subject_ids,
+                                            gallery_subject_ids)
+            fusion_results += [[normalization] + combination.tolist() + ["{:.2f}".format(recognition_rate)]
+                               for combination, recognition_rate in zip(weight_grid, recognition_rates)]
+
+            best_combination = int(np.argmax(recognition_rates))
+            print(f"{Colors.BOLD}INFO: {Colors.ENDC}Best fusion of {Colors.BOLD}{Colors.CRED}" +
+                  " + ".join(fusion_methods) + f"{Colors.ENDC} with protocol {Colors.CCYAN}" + protocol +
+                  f"{Colors.ENDC} and " + normalization + " (weights " +
+                  ", ".join("%g" % weight for weight in weight_grid[best_combination]) + "): " +
+                  "{:.2f}".format(recognition_rates[best_combination]) + "%")
+
+        save_fusion(fusion_methods, protocol, fusion_results)
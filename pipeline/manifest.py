@@ -0,0 +1,166 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import json
+import numpy as np
+import os
+import pathlib
+from helpers.colors import Colors
+from pipeline.feature_store import store_directory_path
+
+
+####################################################
+#                                                  #
+#                 Path Declaration                 #
+#                                                  #
+####################################################
+
+# manifest is kept next to the feature store, both together replace the database at runtime
+manifest_filename = "manifest.json"
+
+
+####################################################
+#                                                  #
+#                    Data Class                    #
+#                                                  #
+####################################################
+
+class ManifestSample:
+    def __init__(self, key, subject_id, reference_id, capture, distance):
+        # same attributes as the database samples (features are assigned during preprocessing)
+        self.key = key
+        self.subject_id = subject_id
+        self.reference_id = reference_id
+        self.capture = capture
+        self.distance = distance
+
+    def __repr__(self):
+        return "ManifestSample(%s)" % self.key
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# protocols written to the manifest (all protocols of the database)
+manifest_protocols = ["close", "medium", "far"]
+# attributes of every sample recorded in the manifest
+manifest_attributes = ["subject_id", "reference_id", "capture", "distance"]
+
+# manifest loaded on first use (empty if it has not been built)
+manifest = None
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to extract the samples of every role of a protocol from the database (probes and gallery are sample sets)
+def get_database_roles(protocol):
+    # bob is imported on first use, hence runs reading the manifest never import it
+    import bob.bio.face
+
+    # define database using chosen protocol and extract samples
+    database = bob.bio.face.database.SCFaceDatabase(protocol)
+
+    return {"probes": database.probes(), "gallery": database.references(),
+            "cohort": database.background_model_samples(),
+            "larger_cohort": database.references(group="eval") + database.probes(group="eval")}
+
+
+# used to convert attributes of database samples into json values (e.g. numpy integers, enumerations)
+def get_json_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return str(value)
+
+
+# used to record the attributes of a sample, returns its key
+def add_manifest_sample(samples, sample):
+    samples[sample.key] = {attribute: get_json_value(getattr(sample, attribute, None))
+                           for attribute in manifest_attributes}
+
+    return sample.key
+
+
+# used to open the manifest, returns False if it has not been built
+def open_manifest(store_directory=store_directory_path):
+    global manifest
+
+    if manifest is None:
+        manifest_file = pathlib.Path(store_directory) / manifest_filename
+        # remember a missing manifest as empty to avoid checking the file again
+        manifest = {}
+        if manifest_file.is_file():
+            with open(manifest_file) as manifest_dev:
+                manifest = json.load(manifest_dev)
+
+    return bool(manifest)
+
+
+# used to create a sample from the attributes recorded for its key
+def get_manifest_sample(key):
+    return ManifestSample(key, **manifest["samples"][key])
+
+
+# used to get probes, gallery and cohort of a protocol from the manifest, returns None if the protocol is not recorded
+def load_manifest_samples(protocol, enable_larger_cohort):
+    if not open_manifest() or protocol not in manifest["protocols"]:
+        return None
+
+    roles = manifest["protocols"][protocol]
+    probes = [[get_manifest_sample(key) for key in sample_set] for sample_set in roles["probes"]]
+    gallery = [[get_manifest_sample(key) for key in sample_set] for sample_set in roles["gallery"]]
+    cohort = [get_manifest_sample(key) for key in roles["cohort"]]
+
+    if enable_larger_cohort:
+        cohort = cohort + [get_manifest_sample(key) for key in roles["larger_cohort"]]
+
+    return probes, gallery, cohort
+
+
+####################################################
+#                                                  #
+#                   File Writing                   #
+#                                                  #
+####################################################
+
+# used to record keys, attributes and roles of all samples of every protocol, hence runs need no database afterwards
+def build_manifest(store_directory=store_directory_path):
+    global manifest
+
+    samples = {}
+    protocols = {}
+    for protocol in manifest_protocols:
+        roles = get_database_roles(protocol)
+        protocols[protocol] = {
+            "probes": [[add_manifest_sample(samples, sample) for sample in sample_set]
+                       for sample_set in roles["probes"]],
+            "gallery": [[add_manifest_sample(samples, sample) for sample in sample_set]
+                        for sample_set in roles["gallery"]],
+            "cohort": [add_manifest_sample(samples, sample) for sample in roles["cohort"]],
+            "larger_cohort": [add_manifest_sample(samples, sample) for sample in roles["larger_cohort"]]
+        }
+
+    store_directory = pathlib.Path(store_directory)
+    store_directory.mkdir(parents=True, exist_ok=True)
+    # write to a temporary file first, hence an interrupted build never leaves a partial manifest
+    temporary_file = store_directory / (manifest_filename + ".tmp")
+    with open(temporary_file, "w") as manifest_dev:
+        json.dump({"samples": samples, "protocols": protocols}, manifest_dev)
+    os.replace(temporary_file, store_directory / manifest_filename)
+    # reload on next use
+    manifest = None
+
+    print(f"{Colors.BOLD}INFO: {Colors.ENDC}Recorded %d samples of %d protocols in '%s'" %
+          (len(samples), len(protocols), store_directory / manifest_filename))
@@ -0,0 +1,193 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import numpy as np
+import scipy.spatial
+
+
+####################################################
+#                                                  #
+#                    Data Class                    #
+#                                                  #
+####################################################
+
+class RankListMatrix:
+    def __init__(self, rank_lists, samples, number_of_ranks):
+        # one contiguous row per sample in the smallest unsigned integer type holding all ranks
+        self.ranks = np.ascontiguousarray(rank_lists, dtype=get_rank_dtype(number_of_ranks))
+        self.reference_ids = np.array([str(sample.reference_id) for sample in samples])
+        self.subject_ids = np.array([str(sample.subject_id) for sample in samples])
+
+    def __len__(self):
+        return len(self.ranks)
+
+    # rows are views of the contiguous matrix
+    def __getitem__(self, index):
+        return self.ranks[index]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.ranks if dtype is None else self.ranks.astype(dtype)
+
+    def holds(self, samples):
+        return len(samples) == len(self.ranks) and \
+            self.reference_ids.tolist() == [str(sample.reference_id) for sample in samples]
+
+
+class QuantizedMatrix:
+    def __init__(self, values, scales):
+        # symmetric int8 values of every row and the scale restoring its features (values times scale)
+        self.values = values
+        self.scales = scales
+
+    def __len__(self):
+        return len(self.values)
+
+    # rows keep their scales
+    def __getitem__(self, index):
+        return QuantizedMatrix(self.values[index], self.scales[index])
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @classmethod
+    def quantize(cls, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        # largest absolute feature of every row is mapped to 127 (rows of zeros keep a scale of one)
+        scales = np.max(np.abs(matrix), axis=1) / 127
+        scales[scales == 0] = 1
+
+        return cls(np.rint(matrix / scales[:, None]).astype(np.int8), scales)
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# upper bound (in bytes) for intermediate matrices computed at once
+memory_budget = 256 * 1024 ** 2
+
+
+# data type of distance matrices (float32 only halves the memory of the returned matrices, cdist computes in float64)
+distance_dtype = np.float64
+
+# precision of normalized embeddings in the baseline and the cohort distances (float64, float32 or int8)
+embedding_precision = "float64"
+available_precisions = ["float64", "float32", "int8"]
+
+
+# setter for memory_budget
+def set_memory_budget(value):
+    global memory_budget
+    memory_budget = value
+
+
+# setter for distance_dtype
+def set_distance_dtype(value):
+    global distance_dtype
+    distance_dtype = np.dtype(value)
+
+
+# setter for embedding_precision
+def set_embedding_precision(value):
+    global embedding_precision
+    embedding_precision = value
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to stack one attribute of all samples into a matrix (one row per sample)
+def stack_samples(samples, attribute="features"):
+    return np.vstack([np.ravel(getattr(sample, attribute)) for sample in samples])
+
+
+# used to get the smallest unsigned integer type holding ranks (or cohort indices) below number_of_ranks
+def get_rank_dtype(number_of_ranks):
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if number_of_ranks <= np.iinfo(dtype).max + 1:
+            return dtype
+
+    return np.uint64
+
+
+# used to get the rank lists of all samples as one matrix, rows are only copied if the samples do not share
+# a rank list matrix
+def stack_rank_lists(samples):
+    rank_list_matrix = getattr(samples[0], "rank_list_matrix", None) if samples else None
+    if rank_list_matrix is None or not rank_list_matrix.holds(samples):
+        return stack_samples(samples, "rank_list")
+
+    return rank_list_matrix.ranks
+
+
+# used to scale every row to unit length (rows of zeros are left untouched)
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+
+    return matrix / norms
+
+
+# used to convert normalized embeddings into the chosen precision (int8 rows are quantized with their own scale)
+def prepare_embeddings(matrix):
+    if embedding_precision == "int8":
+        return QuantizedMatrix.quantize(matrix)
+
+    return np.asarray(matrix, dtype=embedding_precision)
+
+
+# used to calculate the dot products between all rows of two embedding matrices of the same precision
+def embedding_product(row_matrix, column_matrix):
+    if not isinstance(row_matrix, QuantizedMatrix):
+        return row_matrix @ column_matrix.T
+
+    # numpy has no int8 matrix product, but sums of int8 products are exact in float32 below 2 ** 24
+    dtype = np.float32 if 127 ** 2 * row_matrix.shape[1] < 2 ** 24 else np.float64
+    products = row_matrix.values.astype(dtype) @ column_matrix.values.astype(dtype).T
+
+    return products * row_matrix.scales[:, None] * column_matrix.scales[None, :]
+
+
+# used to split a number of rows into blocks whose size (in bytes) stays within the memory budget
+def get_blocks(number_of_rows, bytes_per_row):
+    rows_per_block = max(int(memory_budget // max(bytes_per_row, 1)), 1)
+    for start in range(0, number_of_rows, rows_per_block):
+        yield slice(start, min(start + rows_per_block, number_of_rows))
+
+
+# used to apply a function to all pairs of rows of two matrices in tiles, where the function receives
+# broadcastable arrays of shape (rows, 1, length) and (1, columns, length) and reduces the last axis
+def apply_pairwise(pair_function, row_matrix, column_matrix):
+    scores = np.empty((len(row_matrix), len(column_matrix)))
+    bytes_per_pair = max(row_matrix.shape[1], 1) * scores.itemsize
+    # tile the columns only if a single row of pairs exceeds the memory budget
+    columns_per_tile = min(max(int(memory_budget // bytes_per_pair), 1), max(len(column_matrix), 1))
+    for column_start in range(0, len(column_matrix), columns_per_tile):
+        columns = slice(column_start, min(column_start + columns_per_tile, len(column_matrix)))
+        column_tile = column_matrix[None, columns, :]
+        for rows in get_blocks(len(row_matrix), bytes_per_pair * column_tile.shape[1]):
+            scores[rows, columns] = pair_function(row_matrix[rows, None, :], column_tile)
+
+    return scores
+
+
+# used to calculate distances between all rows of two matrices with scipy's cdist in tiles of rows
+def distance_matrix(row_matrix, column_matrix, metric, **kwargs):
+    row_matrix = np.asarray(row_matrix, dtype=distance_dtype)
+    column_matrix = np.asarray(column_matrix, dtype=distance_dtype)
+    distances = np.empty((len(row_matrix), len(column_matrix)), dtype=distance_dtype)
+    # cdist computes in double precision, hence every tile is sized for float64
+    for rows in get_blocks(len(row_matrix), len(column_matrix) * np.dtype(np.float64).itemsize):
+        distances[rows] = scipy.spatial.distance.cdist(row_matrix[rows], column_matrix, metric, **kwargs)
+
+    return distances
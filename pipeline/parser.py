@@ -5,7 +5,11 @@
 ####################################################
 
 import argparse
-from helpers.categories import get_rank_list_comparison, get_standardization_comparison
+from helpers.categories import get_category, get_rank_list_comparison, get_truncated_rank_list_comparison, \
+    get_standardization_comparison
+from helpers.colors import Colors
+from pipeline.fusion import available_normalizations
+from pipeline.matrices import available_precisions
 
 ####################################################
 #                                                  #
@@ -20,6 +24,10 @@ available_methods = ["baseline", "mueller2010", "schroff", "mueller2013", "wartm
                      "weighted_kendall", "cosine", "braycurtis", "canberra", "cityblock", "sqeuclidean", "minkowski",
                      "rank_list_comparison", "standardization_comparison", "all"]
 available_standardization = ["standardize", "subtract_mean", "omitted"]
+available_score_formats = ["csv", "npz", "both"]
+available_distance_dtypes = ["float64", "float32"]
+available_sweeps = ["wartmann_alpha", "wartmann_beta", "wartmann_both", "wartmann_various", "minkowski_p", "schroff_k",
+                    "mueller2013_lambda"]
 
 # used to filter non-existent methods
 categorical_arguments = ["rank_list_comparison", "standardization_comparison", "all"]
@@ -58,12 +66,245 @@ def parse_input():
                         help="Include to record scores"
                         )
     parser.set_defaults(record_output=False)
+    parser.add_argument("--build_feature_store", "-bfs",
+                        action='store_true',
+                        help="Include to pack all extracted feature files into one memory-mapped feature store"
+                        )
+    parser.set_defaults(build_feature_store=False)
+    parser.add_argument("--build_manifest", "-bm",
+                        action='store_true',
+                        help="Include to record the samples of all protocols in a manifest, hence runs need no database"
+                        )
+    parser.set_defaults(build_manifest=False)
+    parser.add_argument("--loading_workers", "-lw",
+                        type=int,
+                        default=4,
+                        help="Select the number of threads loading features concurrently"
+                        )
+    parser.add_argument("--use_cache", "-uc",
+                        action='store_true',
+                        help="Include to reuse rank lists and standardized lists cached by earlier runs"
+                        )
+    parser.set_defaults(use_cache=False)
+    parser.add_argument("--cache_size", "-cs",
+                        type=int,
+                        default=1024,
+                        help="Select the maximum size of the preprocessing cache in MB"
+                        )
+    parser.add_argument("--clear_cache", "-cc",
+                        action='store_true',
+                        help="Include to invalidate all cached rank lists and standardized lists before running"
+                        )
+    parser.set_defaults(clear_cache=False)
+    parser.add_argument("--score_format", "-sf",
+                        default="csv",
+                        choices=available_score_formats,
+                        help="Select the format of recorded scores (csv is readable by bob)"
+                        )
+    parser.add_argument("--compress_scores", "-cz",
+                        action='store_true',
+                        help="Include to compress recorded scores in npz format"
+                        )
+    parser.set_defaults(compress_scores=False)
+    parser.add_argument("--export_scores", "-es",
+                        nargs="+",
+                        help="Select recorded npz score files which are exported to csv files readable by bob"
+                        )
+    parser.add_argument("--score_matrix", "-sm",
+                        action="store_true",
+                        help="Enable scoring tile by tile into resumable memory-mapped score matrices in output"
+                        )
+    parser.add_argument("--tile_size", "-ts",
+                        type=int,
+                        default=0,
+                        help="Select the number of probes and gallery samples per tile (0 derives it from the budget)"
+                        )
+    parser.add_argument("--memory_budget", "-mb",
+                        type=int,
+                        default=256,
+                        help="Select the maximum size of intermediate matrices and score tiles in MB"
+                        )
+    parser.add_argument("--distance_dtype", "-dd",
+                        default="float64",
+                        choices=available_distance_dtypes,
+                        help="Select the data type of distance matrices (float32 only halves the output memory, "
+                             "cdist computes in float64)"
+                        )
+    parser.add_argument("--fusion", "-fs",
+                        nargs="+",
+                        choices=filter_methods(available_methods, categorical_arguments),
+                        help="Select comparison methods whose stored score matrices are fused (requires --score_matrix)"
+                        )
+    parser.add_argument("--fusion_normalization", "-fn",
+                        nargs="+",
+                        default=available_normalizations,
+                        choices=available_normalizations,
+                        help="Select the normalizations of the score matrices before fusion"
+                        )
+    parser.add_argument("--fusion_weights", "-fw",
+                        type=float,
+                        nargs="+",
+                        default=[0.0, 0.25, 0.5, 0.75, 1.0],
+                        help="Select the weights combined for every fused score matrix"
+                        )
+    parser.add_argument("--cascade", "-ca",
+                        type=int,
+                        nargs="+",
+                        help="Select shortlist sizes of the baseline which are re-ranked by the comparison method"
+                        )
+    parser.add_argument("--fused", "-fu",
+                        action="store_true",
+                        help="Enable scoring all chosen methods of a category in one pass over shared intermediates"
+                        )
+    parser.add_argument("--jobs", "-j",
+                        type=int,
+                        default=1,
+                        help="Select the number of processes running comparison methods and protocols in parallel"
+                        )
+    parser.add_argument("--truncate_rank_lists", "-trl",
+                        type=int,
+                        help="Select the number of best cohort members kept per rank list (schroff and mueller2013)"
+                        )
+    parser.add_argument("--top_k", "-k",
+                        type=int,
+                        help="Select the number of best gallery candidates recorded per probe (shortlist and CMC)"
+                        )
+    parser.add_argument("--evaluate", "-e",
+                        action="store_true",
+                        help="Enable computation of CMC, DET and EER from the scores"
+                        )
+    parser.add_argument("--thresholds", "-th",
+                        type=float,
+                        nargs="+",
+                        help="Select thresholds at which FMR and FNMR are evaluated"
+                        )
+    parser.add_argument("--precision", "-pc",
+                        default="float64",
+                        choices=available_precisions,
+                        help="Select the precision of the embeddings in the baseline and the cohort distances"
+                        )
+    parser.add_argument("--precision_report", "-pcr",
+                        action="store_true",
+                        help="Enable comparison of recognition rates and rank lists of all precisions with float64"
+                        )
+    parser.add_argument("--profile", "-pr",
+                        action="store_true",
+                        help="Enable profiling of the pipeline stages (JSON trace and collapsed stacks in output)"
+                        )
+    parser.add_argument("--sweep", "-sw",
+                        choices=available_sweeps,
+                        help="Select a parameter to sweep (preprocesses once per protocol and writes the plot files)"
+                        )
+    parser.add_argument("--sweep_values", "-sv",
+                        type=float,
+                        nargs="+",
+                        help="Select the swept parameter values (default: grid of the files in plots)"
+                        )
 
     # extract arguments from parser
     args = parser.parse_args()
 
-    return args.comparison_method, args.protocol, args.standardization_method, \
-           args.enable_larger_cohort, args.record_output
+    # pools of processes and loading threads need at least one worker
+    if args.jobs < 1:
+        parser.error("--jobs requires at least 1 process")
+    if args.loading_workers < 1:
+        parser.error("--loading_workers requires at least 1 thread")
+    # a fusion combines the score matrices of at least two comparison methods
+    if args.fusion and len(args.fusion) < 2:
+        parser.error("--fusion requires at least 2 comparison methods")
+    # a shortlist needs at least one candidate and a truncated rank list at least two cohort members
+    if args.top_k is not None and args.top_k < 1:
+        parser.error("--top_k requires at least 1 candidate")
+    if args.truncate_rank_lists is not None and args.truncate_rank_lists < 2:
+        parser.error("--truncate_rank_lists requires at least 2 cohort members")
+    # candidates are only kept to be recorded
+    if args.top_k and not args.record_output:
+        parser.error("--top_k requires --record_output")
+    # the single pass scores whole blocks of probes, hence no tiles of score matrices are written
+    if args.fused and args.score_matrix:
+        parser.error("--fused cannot be combined with --score_matrix")
+    # shortlists are re-ranked within the serial run only and the baseline itself builds the shortlists
+    if args.cascade and (args.jobs > 1 or args.fused):
+        parser.error("--cascade cannot be combined with --jobs greater than 1 or --fused")
+    if args.cascade and args.comparison_method == "baseline":
+        parser.error("--cascade requires a rank list or standardization comparison method")
+    if args.cascade and min(args.cascade) < 1:
+        parser.error("--cascade requires shortlist sizes of at least 1")
+    # the cascade only scores the shortlists, hence no score matrices, evaluation or candidates of all scores exist
+    if args.cascade and (args.score_matrix or args.evaluate or args.top_k):
+        parser.error("--cascade cannot be combined with --score_matrix, --evaluate or --top_k")
+
+    return args
+
+
+def parse_benchmark_input():
+    # initiate parser to record arguments
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Time preprocessing and comparison methods on synthetic embeddings'
+    )
+
+    # add arguments
+    parser.add_argument("--comparison_method", "-c",
+                        default="all",
+                        choices=available_methods,
+                        help="Select the timed comparison method"
+                        )
+    parser.add_argument("--probes", "-np",
+                        type=int,
+                        nargs="+",
+                        default=[200],
+                        help="Select the numbers of probes"
+                        )
+    parser.add_argument("--gallery", "-ng",
+                        type=int,
+                        nargs="+",
+                        default=[130],
+                        help="Select the numbers of gallery subjects"
+                        )
+    parser.add_argument("--cohort", "-nc",
+                        type=int,
+                        nargs="+",
+                        default=[43],
+                        help="Select the numbers of cohort subjects"
+                        )
+    parser.add_argument("--dimension", "-d",
+                        type=int,
+                        nargs="+",
+                        default=[512],
+                        help="Select the embedding dimensions"
+                        )
+    parser.add_argument("--repeats", "-r",
+                        type=int,
+                        default=3,
+                        help="Select how often every function is timed (the fastest run is reported)"
+                        )
+    parser.add_argument("--per_pair", "-pp",
+                        action="store_true",
+                        help="Include to time the per-pair comparison functions as well"
+                        )
+    parser.add_argument("--seed",
+                        type=int,
+                        default=0,
+                        help="Select the seed of the synthetic embeddings"
+                        )
+    parser.add_argument("--output", "-o",
+                        default="output/benchmark.json",
+                        help="Select the file the results are saved to"
+                        )
+    parser.add_argument("--compare", "-cmp",
+                        nargs=2,
+                        metavar=("REFERENCE", "NEW"),
+                        help="Select two result files to compare instead of running the benchmark"
+                        )
+    parser.add_argument("--threshold", "-t",
+                        type=float,
+                        default=0.1,
+                        help="Select the relative slowdown above which a result is flagged as regression"
+                        )
+
+    # extract arguments from parser
+    return parser.parse_args()
 
 
 ####################################################
@@ -77,6 +318,17 @@ def filter_methods(methods, methods_to_filter):
     return [method for method in methods if method not in methods_to_filter]
 
 
+# used to drop rank list methods which require full rank lists
+def filter_truncated_methods(comparison_methods):
+    dropped_methods = [method for method in comparison_methods if get_category(method) == "rank-list-comparison"
+                       and method not in get_truncated_rank_list_comparison()]
+    if dropped_methods:
+        print(f"{Colors.BOLD}{Colors.CRED}WARNING:{Colors.ENDC} Skipping %s (truncated rank lists are only supported "
+              "by %s)" % (", ".join(dropped_methods), ", ".join(get_truncated_rank_list_comparison())))
+
+    return filter_methods(comparison_methods, dropped_methods)
+
+
 # used to create list of chosen protocol and method
 def generate_lists(comparison_method, protocol):
     if comparison_method not in categorical_arguments:
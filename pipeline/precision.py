@@ -0,0 +1,134 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import csv
+import numpy as np
+import pathlib
+import pipeline.matrices as matrices
+from helpers.categories import get_category
+from helpers.colors import Colors
+from pipeline.cascade import count_matches
+from pipeline.comparison import get_comparison_matrices, get_matrix_function
+from pipeline.matrices import get_blocks, stack_samples, stack_rank_lists, set_embedding_precision
+from pipeline.preprocessing import run_preprocessing
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# precisions compared in the report, the first one is the reference of all others
+report_precisions = ["float64", "float32", "int8"]
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to get the index of the best gallery candidate of every probe
+def get_best_candidates(comparison_method, probe_matrix, gallery_matrix):
+    matrix_function = get_matrix_function(comparison_method)
+    best_candidates = np.empty(len(probe_matrix), dtype=np.int64)
+    for block in get_blocks(len(probe_matrix), len(gallery_matrix) * np.dtype(np.float64).itemsize):
+        best_candidates[block] = np.argmax(matrix_function(probe_matrix[block], gallery_matrix), axis=1)
+
+    return best_candidates
+
+
+# used to get the ranks of the cohort members in the lists of all samples (None for the baseline), the
+# standardization is monotone per row, hence standardized lists are ranked like their cosine distances
+def get_cohort_ranks(samples, category):
+    if category == "rank-list-comparison":
+        return np.asarray(stack_rank_lists(samples))
+    if category:
+        return np.argsort(np.argsort(stack_samples(samples, "standardized_distances"), axis=1), axis=1)
+
+    return None
+
+
+# used to get the share of equal ranks and the share of identical lists (in percent) compared to the reference
+def get_rank_agreement(reference_ranks, cohort_ranks):
+    if reference_ranks is None:
+        return "-", "-"
+
+    equal_ranks = reference_ranks == cohort_ranks
+
+    return "{:.2f}".format(np.mean(equal_ranks) * 100), "{:.2f}".format(np.mean(np.all(equal_ranks, axis=1)) * 100)
+
+
+# used to save the report with one row per comparison method, protocol and precision
+def save_precision_report(report_rows):
+    # create output directory
+    pathlib.Path("output").mkdir(exist_ok=True)
+
+    with open("output/precision-report.csv", 'w', newline='') as report_dev:
+        report_writer = csv.writer(report_dev)
+        report_writer.writerow(['comparison_method', 'protocol', 'precision', 'recog_rate (%)',
+                                'recog_rate_delta (%)', 'top1_agreement (%)', 'rank_agreement (%)',
+                                'identical_rank_lists (%)'])
+        report_writer.writerows(report_rows)
+
+
+####################################################
+#                                                  #
+#                    Algorithm                     #
+#                                                  #
+####################################################
+
+# used to run the chosen methods with every precision and to compare recognition rates, best candidates and
+# rank lists with the float64 results
+def run_precision_report(comparison_methods, protocols, standardization_method, enable_larger_cohort):
+    chosen_precision = matrices.embedding_precision
+    categories = []
+    for comparison_method in comparison_methods:
+        if get_category(comparison_method) not in categories:
+            categories.append(get_category(comparison_method))
+
+    report = {}
+    for category in categories:
+        category_methods = [comparison_method for comparison_method in comparison_methods
+                            if get_category(comparison_method) == category]
+        for protocol in protocols:
+            reference_ranks = None
+            reference_results = {}
+            for precision in report_precisions:
+                set_embedding_precision(precision)
+                probe_samples, gallery_samples = run_preprocessing(
+                    category, protocol, standardization_method, enable_larger_cohort
+                )
+                probe_matrix, gallery_matrix = get_comparison_matrices(probe_samples, gallery_samples, category)
+
+                cohort_ranks = get_cohort_ranks(probe_samples + gallery_samples, category)
+                if precision == report_precisions[0]:
+                    reference_ranks = cohort_ranks
+                rank_agreement = get_rank_agreement(reference_ranks, cohort_ranks)
+
+                for comparison_method in category_methods:
+                    best_candidates = get_best_candidates(comparison_method, probe_matrix, gallery_matrix)
+                    recognition_rate = count_matches(probe_samples, gallery_samples, best_candidates) / \
+                        len(probe_samples) * 100
+                    if precision == report_precisions[0]:
+                        reference_results[comparison_method] = (recognition_rate, best_candidates)
+                    reference_rate, reference_candidates = reference_results[comparison_method]
+                    report[comparison_method, protocol, precision] = [
+                        "{:.2f}".format(recognition_rate), "{:+.2f}".format(recognition_rate - reference_rate),
+                        "{:.2f}".format(np.mean(best_candidates == reference_candidates) * 100), *rank_agreement
+                    ]
+                    print(f"{Colors.BOLD}INFO: {Colors.ENDC}Finished {Colors.BOLD}{Colors.CRED}" +
+                          comparison_method + f"{Colors.ENDC} with protocol {Colors.CCYAN}" + protocol +
+                          f"{Colors.ENDC} in " + precision + ": " + report[comparison_method, protocol, precision][0] +
+                          "% (" + report[comparison_method, protocol, precision][1] + ")")
+
+    set_embedding_precision(chosen_precision)
+
+    # rows are written per comparison method in the order of the protocols
+    save_precision_report([[comparison_method, protocol, precision] + report[comparison_method, protocol, precision]
+                           for comparison_method in comparison_methods for protocol in protocols
+                           for precision in report_precisions])
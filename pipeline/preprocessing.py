@@ -4,15 +4,22 @@
 #                                                  #
 ####################################################
 
-import bob.bio.face
-import bob.io.base
 import numpy as np
-import scipy.spatial
 import pathlib
 import time
+from concurrent.futures import ThreadPoolExecutor
 from helpers.colors import Colors
 from helpers.file_writing import set_preprocess_time
-from pipeline.comparison import set_schroff_k
+from helpers.profiling import span
+from pipeline.cache import get_cache_key, load_cached_lists, save_cached_lists
+import pipeline.comparison as comparison
+from pipeline.comparison import set_schroff_k, get_mueller2013_truncation_bound
+from pipeline.feature_store import get_stored_features
+from pipeline.cohort import get_cohort_model, get_cohort_id, get_mugshot_samples, save_cohort_model
+from pipeline.manifest import get_database_roles, load_manifest_samples
+from pipeline.score_matrix import set_score_lists, get_cohort_variant
+import pipeline.matrices as matrices
+from pipeline.matrices import RankListMatrix, stack_samples, normalize_rows, prepare_embeddings, embedding_product
 
 
 ####################################################
@@ -26,55 +33,94 @@ file_path = str(pathlib.Path().resolve())
 directory_path = file_path + "/samples_pipe_all/samplewrapper-2/"
 
 
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# number of threads loading features concurrently
+loading_workers = 4
+
+# gallery lists computed so far (keyed by cohort and list method), the gallery is identical for all protocols
+shared_gallery_lists = {}
+
+
+# setter for loading_workers
+def set_loading_workers(value):
+    global loading_workers
+    loading_workers = max(value, 1)
+
+
 ####################################################
 #                                                  #
 #                  Helper Methods                  #
 #                                                  #
 ####################################################
 
-# used to extract probes, gallery and cohort from database
+# used to extract probes, gallery and cohort from the manifest or, if it has not been built, from the database
 def extract_samples(protocol, enable_larger_cohort):
-    # define database using chosen protocol and extract samples
-    database = bob.bio.face.database.SCFaceDatabase(protocol)
-    probes = database.probes()
-    gallery = database.references()
-    cohort = database.background_model_samples()
+    manifest_samples = load_manifest_samples(protocol, enable_larger_cohort)
+    if manifest_samples is not None:
+        return manifest_samples
+
+    roles = get_database_roles(protocol)
+    cohort = roles["cohort"]
 
     if enable_larger_cohort:
-        cohort = cohort + database.references(group="eval") + database.probes(group="eval")
+        cohort = cohort + roles["larger_cohort"]
 
-    return probes, gallery, cohort
+    return roles["probes"], roles["gallery"], cohort
 
 
-# load features of single sample
+# load features of single sample, returns the filename if the file was not found
 def load_features(sample):
     sample_key = sample.key
+    # attach features as view into the packed feature store if it was built
+    stored_features = get_stored_features(sample_key)
+    if stored_features is not None:
+        sample.features = stored_features
+        return None
+
+    import bob.io.base
+
     # add file extension to key
     new_sample_key = sample_key + ".h5"
     # try loading from destination
     try:
         sample_features = bob.io.base.load(directory_path + new_sample_key)
         sample.features = sample_features
-    # terminate if file not found
+    # report if file not found
     except RuntimeError:
-        print(f"\n{Colors.BOLD}{Colors.CRED}WARNING:{Colors.ENDC} File '%s' not found!\n\n"
-              f"{Colors.BOLD}{Colors.CRED}PROCESS TERMINATED{Colors.ENDC}" % new_sample_key)
-        exit()
+        return new_sample_key
 
-    return sample
+    return None
 
 
-# used to loop through samples and assign each with its features
-def assign_features(image_set, including_set=True):
-    if including_set:
-        for sample_set in image_set:
-            for sample in sample_set:
-                load_features(sample)
-    else:
-        for sample in image_set:
-            load_features(sample)
+# used to start loading the features of all samples on the loading workers (one future per sample)
+def assign_features(executor, samples):
+    return [executor.submit(load_features, sample) for sample in samples]
 
-    return image_set
+
+# used to wait until features are assigned, terminates after all loads are done if any file was not found
+def wait_for_features(feature_loads, *pending_feature_loads):
+    with span("feature_loading"):
+        missing_files = [feature_load.result() for feature_load in feature_loads if feature_load.result()]
+
+    if missing_files:
+        # wait for pending loads as well to report all missing files at once
+        for pending_loads in pending_feature_loads:
+            missing_files += [feature_load.result() for feature_load in pending_loads if feature_load.result()]
+        print(f"\n{Colors.BOLD}{Colors.CRED}WARNING:{Colors.ENDC} %d file(s) not found:\n" % len(missing_files) +
+              "\n".join(missing_files) +
+              f"\n\n{Colors.BOLD}{Colors.CRED}PROCESS TERMINATED{Colors.ENDC}")
+        exit()
+
+
+# used to load the features of all samples which have none assigned yet
+def load_missing_features(samples):
+    with ThreadPoolExecutor(max_workers=loading_workers) as executor:
+        wait_for_features(assign_features(executor, [sample for sample in samples if not hasattr(sample, "features")]))
 
 
 # used to extract samples for sample sets
@@ -86,95 +132,145 @@ def unwrap_sets(image_set, collected_samples):
             collected_samples.append(sample)
 
 
-# used to split cohort samples into cohort probes and cohort gallery
-def split_cohort(cohort_samples, protocol):
-    # instantiate dictionaries for probe and gallery cohort samples
-    cohort_probes = {}
-    cohort_gallery = {}
-
-    for sample in cohort_samples:
-        # extract the ’capture’ attribute
-        curr_capture = sample.capture
-
-        # check capture to distinguish between probe and gallery cohort
-        if str(curr_capture) == "surveillance":
-            # check for the protocol used when defining the database
-            if str(sample.distance) == protocol:
-                curr_subject_id = sample.subject_id
-                # add an entry if subject_id is not yet in the dictionary
-                if curr_subject_id not in cohort_probes:
-                    cohort_probes[curr_subject_id] = [sample.features]
-                # else extract already recorded features and add current ones
-                else:
-                    cohort_probes.get(curr_subject_id).append(sample.features)
-        elif str(curr_capture) == "mugshot":
-            cohort_gallery[sample.subject_id] = sample.features
-
-    return cohort_probes, cohort_gallery
-
-
-# used to take the average of all features from samples with the same subject_id
-def calculate_average(cohort_probes):
-    # instantiate dictionary for subjects w/ averaged features
-    averaged_features = {}
-
-    # loop through subjects with several features to calculate the average
-    for subject_id, features in cohort_probes.items():
-        # calculate the average of all features
-        curr_average_features = np.mean(features, axis=0)
-        # add average to dictionary
-        averaged_features[subject_id] = curr_average_features
-
-    return averaged_features
-
-
-# used to calculate cosine distances between one probe/gallery and cohort
-def get_cosine_distances(sample, cohort_samples):
-    # instantiate list for calculated cosine distances between sample and all cohort samples
-    cosine_distances = []
-
-    for key in sorted(cohort_samples.keys()):
-        # calculate and save cosine distance between sample and current cohort sample
-        cosine_distances.append(
-            scipy.spatial.distance.cosine(sample.features, cohort_samples[key])
-        )
+# used to calculate cosine distances between all probes/gallery samples and the normalized cohort matrix at once
+def get_cosine_distances(samples, cohort_matrix):
+    # normalize once, hence every cosine distance is one minus a dot product
+    with span("distance_computation"):
+        sample_features = prepare_embeddings(normalize_rows(stack_samples(samples)))
 
-    return np.array(cosine_distances)
+        return 1 - embedding_product(sample_features, prepare_embeddings(cohort_matrix))
 
 
-# used to convert cosine distances into rank lists
-def generate_rank_list(samples, cohort_samples):
+# used to assign every sample its row of a matrix (rank lists or standardized distances)
+def assign_rows(samples, matrix, attribute):
+    for sample, row in zip(samples, matrix):
+        setattr(sample, attribute, row)
+
+
+# used to add rank lists or standardized lists to the samples
+def assign_lists(category, samples, lists, cohort_size):
+    if category == "rank-list-comparison":
+        if not isinstance(lists, RankListMatrix):
+            lists = RankListMatrix(lists, samples, cohort_size)
+        assign_rank_lists(samples, lists)
+    else:
+        assign_rows(samples, lists, "standardized_distances")
+
+
+# used to get the preprocessing method recorded next to the runtime (baseline, rank-list or standardization method)
+def get_preprocess_method(category, standardization_method):
+    if category == "rank-list-comparison":
+        return "rank-list"
+    elif category:
+        return standardization_method
+
+    return "baseline"
+
+
+# used to identify how lists are computed (e.g. features, rank-list, rank-list-top50, standardize-int8)
+def get_list_method(category, standardization_method):
+    if not category:
+        list_method = "features"
+    elif category != "rank-list-comparison":
+        list_method = standardization_method
+    elif comparison.rank_list_truncation:
+        list_method = "rank-list-top%d" % comparison.rank_list_truncation
+    else:
+        list_method = "rank-list"
+
+    # lists computed from lower precision embeddings are kept apart from the float64 ones
+    if matrices.embedding_precision != "float64":
+        list_method += "-" + matrices.embedding_precision
+
+    return list_method
+
+
+# used to get the gallery lists computed for another protocol, returns None if the gallery was not preprocessed yet,
+# gallery lists only depend on the mugshot side of the cohort, hence they are identified by its mugshot samples
+def get_shared_gallery_lists(cohort, list_method, gallery_samples):
+    shared_lists = shared_gallery_lists.get((get_cohort_id(get_mugshot_samples(cohort)), list_method))
+    if shared_lists is None or shared_lists[0] != [sample.key for sample in gallery_samples]:
+        return None
+
+    return shared_lists[1]
+
+
+# used to keep the gallery lists for the remaining protocols
+def share_gallery_lists(cohort, list_method, gallery_samples, gallery_lists):
+    shared_gallery_lists[get_cohort_id(get_mugshot_samples(cohort)), list_method] = (
+        [sample.key for sample in gallery_samples], gallery_lists
+    )
+
+
+# used to add rank lists to the samples as views of a shared rank list matrix
+def assign_rank_lists(samples, rank_list_matrix):
+    assign_rows(samples, rank_list_matrix, "rank_list")
     for sample in samples:
-        cosine_distances = get_cosine_distances(sample, cohort_samples)
-        # use argsort to convert into array of orders
-        order = np.argsort(cosine_distances)
-        # use argsort again to convert into rank list and add it to sample
-        sample.rank_list = np.argsort(order)
+        sample.rank_list_matrix = rank_list_matrix
+
+
+# used to convert cosine distances into rank lists
+def generate_rank_list(samples, cohort_matrix):
+    cosine_distances = get_cosine_distances(samples, cohort_matrix)
+    with span("ranking"):
+        # keep only the best cohort members if rank lists are truncated
+        if comparison.rank_list_truncation:
+            rank_lists = truncate_rank_lists(cosine_distances, comparison.rank_list_truncation)
+        else:
+            # use argsort to convert each row into array of orders
+            order = np.argsort(cosine_distances, axis=1)
+            # use argsort again to convert into rank lists
+            rank_lists = np.argsort(order, axis=1)
+
+        # store rank lists in one compact matrix and add its rows to the samples
+        rank_list_matrix = RankListMatrix(rank_lists, samples, len(cohort_matrix))
+    assign_rank_lists(samples, rank_list_matrix)
+
+    return rank_list_matrix
+
+
+# used to get the indices of the best cohort members of every row ordered by rank (partial selection instead of
+# sorting all cohort members)
+def truncate_rank_lists(cosine_distances, truncation):
+    truncation = min(truncation, cosine_distances.shape[1])
+    best_members = np.argpartition(cosine_distances, truncation - 1, axis=1)[:, :truncation]
+    order = np.argsort(np.take_along_axis(cosine_distances, best_members, axis=1), axis=1, kind="stable")
+
+    return np.take_along_axis(best_members, order, axis=1)
 
 
 # used to standardize lists with cosine distances
-def standardize(samples, cohort_samples):
-    for sample in samples:
-        cosine_distances = get_cosine_distances(sample, cohort_samples)
-        # subtract mean from list and divide by standard deviation
-        sample.standardized_distances = np.divide(np.subtract(cosine_distances, np.mean(cosine_distances)),
-                                                  np.std(cosine_distances))
+def standardize(samples, cohort_matrix):
+    cosine_distances = get_cosine_distances(samples, cohort_matrix)
+    with span("standardization"):
+        # subtract mean from each row and divide by its standard deviation
+        standardized_distances = np.divide(
+            np.subtract(cosine_distances, np.mean(cosine_distances, axis=1, keepdims=True)),
+            np.std(cosine_distances, axis=1, keepdims=True)
+        )
+    assign_rows(samples, standardized_distances, "standardized_distances")
+
+    return standardized_distances
 
 
 # used to subtract mean from lists with cosine distances
-def subtract_mean(samples, cohort_samples):
-    for sample in samples:
-        cosine_distances = get_cosine_distances(sample, cohort_samples)
-        # subtract mean from list
-        sample.standardized_distances = np.subtract(cosine_distances, np.mean(cosine_distances))
+def subtract_mean(samples, cohort_matrix):
+    cosine_distances = get_cosine_distances(samples, cohort_matrix)
+    with span("standardization"):
+        # subtract mean from each row
+        standardized_distances = np.subtract(cosine_distances, np.mean(cosine_distances, axis=1, keepdims=True))
+    assign_rows(samples, standardized_distances, "standardized_distances")
+
+    return standardized_distances
 
 
 # used to omit standardization
-def omitted(samples, cohort_samples):
-    for sample in samples:
-        cosine_distances = get_cosine_distances(sample, cohort_samples)
-        # directly assign without standardization
-        sample.standardized_distances = cosine_distances
+def omitted(samples, cohort_matrix):
+    cosine_distances = get_cosine_distances(samples, cohort_matrix)
+    # directly assign without standardization
+    assign_rows(samples, cosine_distances, "standardized_distances")
+
+    return cosine_distances
 
 
 ####################################################
@@ -186,8 +282,6 @@ def omitted(samples, cohort_samples):
 # used to set up comparison before execution (extraction and preprocessing)
 def run_preprocessing(category, protocol, standardization_method, enable_larger_cohort):
     probes, gallery, cohort = extract_samples(protocol, enable_larger_cohort)
-    probes = assign_features(probes)
-    gallery = assign_features(gallery)
 
     # unwrap samples
     probe_samples = []
@@ -200,36 +294,91 @@ def run_preprocessing(category, protocol, standardization_method, enable_larger_
         # used for measuring preprocessing time
         start_time_cpu = time.process_time()
 
-        cohort = assign_features(cohort, including_set=False)
-        cohort_probes, cohort_gallery = split_cohort(cohort, protocol)
-        # several samples in cohort_probes refer to the same subject,
-        # therefore features must be averaged
-        cohort_probes_averaged = calculate_average(cohort_probes)
-
-        # usage of rank lists -> generate rank lists
+        # skip preprocessing if the lists were computed from the same features before
+        preprocess_method = get_preprocess_method(category, standardization_method)
+        cache_key = get_cache_key(protocol, enable_larger_cohort, get_list_method(category, standardization_method),
+                                  probe_samples + gallery_samples + cohort)
+        cached_lists = load_cached_lists(cache_key, probe_samples, gallery_samples)
+        if cached_lists:
+            probe_lists, gallery_lists, cohort_size = cached_lists
+            assign_lists(category, probe_samples, probe_lists, cohort_size)
+            assign_lists(category, gallery_samples, gallery_lists, cohort_size)
+        else:
+            probe_lists, gallery_lists, cohort_size = compute_lists(
+                category, protocol, standardization_method, enable_larger_cohort, probe_samples, gallery_samples,
+                cohort
+            )
+            save_cached_lists(cache_key, probe_samples, gallery_samples, probe_lists, gallery_lists, cohort_size)
+
+        # stop and save time measurement
+        stop_time_cpu = time.process_time()
+        preprocess_time = stop_time_cpu - start_time_cpu
+        set_preprocess_time(preprocess_method, protocol, preprocess_time)
+
+        # optimize schroff parameter (independent of the truncation, hence schroff is never redefined)
         if category == "rank-list-comparison":
-            generate_rank_list(probe_samples, cohort_probes_averaged)
-            generate_rank_list(gallery_samples, cohort_gallery)
-
-            # stop and save time measurement
-            stop_time_cpu = time.process_time()
-            preprocess_time = stop_time_cpu - start_time_cpu
-            set_preprocess_time("rank-list", protocol, preprocess_time)
-
-            # optimize schroff parameter
-            set_schroff_k(len(cohort_probes_averaged))
-
-        # usage of lists w/o converting to rank -> standardize lists
-        elif category == "standardization_comparison":
-            standardization_function = eval(standardization_method)
-            standardization_function(probe_samples, cohort_probes_averaged)
-            standardization_function(gallery_samples, cohort_gallery)
-
-            # stop and save time measurement
-            stop_time_cpu = time.process_time()
-            preprocess_time = stop_time_cpu - start_time_cpu
-            set_preprocess_time(standardization_method, protocol, preprocess_time)
+            set_schroff_k(cohort_size)
+        if category == "rank-list-comparison" and comparison.rank_list_truncation:
+            # truncated rank lists hold the ranks up to truncation - 1 only, schroff weighs ranks up to schroff_k
+            if comparison.rank_list_truncation < min(comparison.schroff_k + 1, cohort_size):
+                print(f"{Colors.BOLD}{Colors.CRED}WARNING:{Colors.ENDC} Truncated rank lists approximate schroff " +
+                      "(k = %d is only exact for a truncation of at least %d)" %
+                      (comparison.schroff_k, min(comparison.schroff_k + 1, cohort_size)))
+            bound = get_mueller2013_truncation_bound(comparison.rank_list_truncation, cohort_size)
+            print(f"{Colors.BOLD}INFO: {Colors.ENDC}Truncated rank lists lower mueller2013 scores by at most %.4g" %
+                  bound)
     else:
+        with ThreadPoolExecutor(max_workers=loading_workers) as executor:
+            probe_loads = assign_features(executor, probe_samples)
+            gallery_loads = assign_features(executor, gallery_samples)
+            wait_for_features(probe_loads, gallery_loads)
+            wait_for_features(gallery_loads)
         set_preprocess_time("baseline", protocol, 0)
 
+    # stored score matrices are identified by the lists and the cohort they are computed from
+    set_score_lists(get_list_method(category, standardization_method),
+                    get_cohort_variant(category, enable_larger_cohort))
+
     return probe_samples, gallery_samples
+
+
+# used to load features and compute rank lists or standardized lists, returns both lists and the cohort size
+def compute_lists(category, protocol, standardization_method, enable_larger_cohort, probe_samples, gallery_samples,
+                  cohort):
+    # cohort model is shared by all protocols and methods, hence only missing sides of the cohort are loaded
+    cohort_model = get_cohort_model(cohort, protocol, enable_larger_cohort)
+    required_cohort = cohort_model.get_required_samples(cohort, protocol)
+    # gallery is preprocessed once for all protocols, hence it is only loaded for the first one
+    list_method = get_list_method(category, standardization_method)
+    gallery_lists = get_shared_gallery_lists(cohort, list_method, gallery_samples)
+
+    with ThreadPoolExecutor(max_workers=loading_workers) as executor:
+        # cohort is loaded first, probes and gallery are loaded while the cohort is processed
+        cohort_loads = assign_features(executor, required_cohort)
+        probe_loads = assign_features(executor, probe_samples)
+        gallery_loads = assign_features(executor, gallery_samples) if gallery_lists is None else []
+
+        wait_for_features(cohort_loads, probe_loads, gallery_loads)
+        if not cohort_model.has_protocol(protocol):
+            # several samples in the probe side refer to the same subject, therefore features are averaged
+            cohort_model.build(required_cohort, protocol)
+            save_cohort_model(cohort_model, cohort, protocol, enable_larger_cohort)
+        cohort_probes = cohort_model.get_probe_matrix(protocol)
+
+        # usage of rank lists -> generate rank lists,
+        # usage of lists w/o converting to rank -> standardize lists
+        if category == "rank-list-comparison":
+            preprocessing_function = generate_rank_list
+        else:
+            preprocessing_function = eval(standardization_method)
+
+        wait_for_features(probe_loads, gallery_loads)
+        probe_lists = preprocessing_function(probe_samples, cohort_probes)
+        if gallery_lists is None:
+            wait_for_features(gallery_loads)
+            gallery_lists = preprocessing_function(gallery_samples, cohort_model.gallery_matrix)
+            share_gallery_lists(cohort, list_method, gallery_samples, gallery_lists)
+        else:
+            assign_lists(category, gallery_samples, gallery_lists, len(cohort_probes))
+
+    return probe_lists, gallery_lists, len(cohort_probes)
@@ -0,0 +1,220 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import helpers.file_writing as file_writing
+import helpers.profiling as profiling
+import numpy as np
+import pathlib
+import pipeline.comparison as comparison
+import pipeline.evaluation as evaluation
+import pipeline.matrices as matrices
+import pipeline.score_matrix as score_matrix
+import tempfile
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+from helpers.categories import get_category
+from helpers.colors import Colors
+from helpers.profiling import span, set_profiling_enabled, pop_span_records, merge_span_records
+from helpers.file_writing import create_score_sink, open_recognition_file, save_shortlist, save_results, \
+    close_files, set_preprocess_time, get_preprocess_time, reset_recognition, set_score_format, set_compress_scores
+from pipeline.comparison import get_comparison_matrices, compare_matrices, set_schroff_k, set_top_k, \
+    set_rank_list_truncation
+from pipeline.evaluation import create_evaluation, get_evaluation_runtime, finish_evaluation, save_evaluation, \
+    set_evaluation_enabled, set_evaluation_thresholds
+from pipeline.matrices import QuantizedMatrix, set_memory_budget, set_distance_dtype
+from pipeline.preprocessing import run_preprocessing, get_preprocess_method
+from pipeline.score_matrix import set_score_matrix_enabled, set_tile_size, set_score_lists, get_resumed_runtime
+
+
+####################################################
+#                                                  #
+#                 Path Declaration                 #
+#                                                  #
+####################################################
+
+# preprocessed matrices are shared with the workers through memory-mapped files in shared memory (if available)
+shared_directory_path = "/dev/shm" if pathlib.Path("/dev/shm").is_dir() else None
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to write a matrix to a memory-mapped file which every worker maps instead of receiving a pickled copy
+def share_matrix(matrix, directory, name):
+    # quantized embeddings are shared as values and scales
+    if isinstance(matrix, QuantizedMatrix):
+        return share_matrix(matrix.values, directory, name + "-values"), \
+            share_matrix(matrix.scales, directory, name + "-scales")
+
+    path = str(pathlib.Path(directory) / (name + ".npy"))
+    shared_matrix = np.lib.format.open_memmap(path, mode="w+", dtype=matrix.dtype, shape=matrix.shape)
+    shared_matrix[:] = matrix
+    shared_matrix.flush()
+
+    return path
+
+
+# used to map a shared matrix in a worker
+def load_shared_matrix(path):
+    if isinstance(path, tuple):
+        return QuantizedMatrix(*[np.load(part, mmap_mode="r") for part in path])
+
+    return np.load(path, mmap_mode="r")
+
+
+# used to keep only the ids of samples (sample objects of the database are not sent to the workers)
+def get_ids(samples):
+    return [(sample.reference_id, sample.subject_id) for sample in samples]
+
+
+# used to create samples holding only the ids (used for matches and written files)
+def get_id_samples(ids):
+    return [types.SimpleNamespace(reference_id=reference_id, subject_id=subject_id) for reference_id, subject_id in ids]
+
+
+# used to apply the settings of the main process in every worker
+def initialize_worker(rank_list_truncation, top_k, evaluation_enabled, evaluation_thresholds, memory_budget,
+                      distance_dtype, score_format, compress_scores, score_matrix_enabled, tile_size,
+                      profiling_enabled):
+    set_rank_list_truncation(rank_list_truncation)
+    set_top_k(top_k)
+    set_evaluation_enabled(evaluation_enabled)
+    set_evaluation_thresholds(evaluation_thresholds)
+    set_memory_budget(memory_budget)
+    set_distance_dtype(distance_dtype)
+    set_score_format(score_format)
+    set_compress_scores(compress_scores)
+    set_score_matrix_enabled(score_matrix_enabled)
+    set_tile_size(tile_size)
+    set_profiling_enabled(profiling_enabled)
+    # forked workers inherit the spans of the main process, which are already recorded there
+    pop_span_records()
+
+
+# used to run a single comparison method on a single protocol in a worker, returns positive matches, runtime,
+# evaluation (None if disabled), shortlist with cmc (None if not recorded) and the spans recorded during the job,
+# which are written by the main process
+def run_job(comparison_method, protocol, matrix_paths, probe_ids, gallery_ids, schroff_k, score_lists,
+            record_output):
+    # optimize schroff parameter
+    if schroff_k:
+        set_schroff_k(schroff_k)
+    # used to identify stored score matrices
+    set_score_lists(*score_lists)
+
+    probe_matrix, gallery_matrix = [load_shared_matrix(path) for path in matrix_paths]
+    probe_samples = get_id_samples(probe_ids)
+    gallery_samples = get_id_samples(gallery_ids)
+
+    # used to record scores
+    if record_output:
+        create_score_sink(comparison_method, protocol)
+    create_evaluation()
+
+    # spans are recorded like the comparison of a serial run
+    with span("comparison"):
+        # used for measuring runtime
+        start_time_cpu = time.process_time()
+
+        positive_matches, shortlist = compare_matrices(probe_matrix, gallery_matrix, probe_samples, gallery_samples,
+                                                       comparison_method, protocol)
+
+        # stop runtime measurement, collecting the scores for the evaluation is not part of the comparison and
+        # tiles of a resumed score matrix count with the time of the run that scored them
+        stop_time_cpu = time.process_time()
+        runtime = stop_time_cpu - start_time_cpu - get_evaluation_runtime() + get_resumed_runtime()
+
+        # best candidates of every probe and the cumulative match characteristic
+        if not record_output:
+            shortlist = None
+
+        evaluation_results = finish_evaluation()
+        if record_output:
+            with span("output_writing"):
+                close_files()
+
+    return positive_matches, runtime, evaluation_results, shortlist, pop_span_records()
+
+
+####################################################
+#                                                  #
+#                    Algorithm                     #
+#                                                  #
+####################################################
+
+# used to run the grid of comparison methods and protocols as independent jobs on a pool of processes
+def run_scheduler(comparison_methods, protocols, standardization_method, enable_larger_cohort, record_output, jobs):
+    categories = []
+    for comparison_method in comparison_methods:
+        if get_category(comparison_method) not in categories:
+            categories.append(get_category(comparison_method))
+
+    with tempfile.TemporaryDirectory(dir=shared_directory_path) as directory:
+        # preprocess once per category and protocol, all methods of a category share the matrices
+        preprocessed = {}
+        for category in categories:
+            for protocol in protocols:
+                with span("preprocessing"):
+                    probe_samples, gallery_samples = run_preprocessing(
+                        category, protocol, standardization_method, enable_larger_cohort
+                    )
+                probe_matrix, gallery_matrix = get_comparison_matrices(probe_samples, gallery_samples, category)
+                name = (category or "baseline") + "-" + protocol
+                matrix_paths = [share_matrix(probe_matrix, directory, name + "-probes"),
+                                share_matrix(gallery_matrix, directory, name + "-gallery")]
+                # schroff parameter is optimized during preprocessing of the rank lists
+                schroff_k = comparison.schroff_k if category == "rank-list-comparison" else None
+                score_lists = (score_matrix.list_method, score_matrix.cohort_variant)
+                preprocessed[category, protocol] = (matrix_paths, get_ids(probe_samples), get_ids(gallery_samples),
+                                                    schroff_k, score_lists, get_preprocess_time(protocol))
+
+        worker_settings = (comparison.rank_list_truncation, comparison.top_k, evaluation.evaluation_enabled,
+                           evaluation.evaluation_thresholds, matrices.memory_budget, matrices.distance_dtype,
+                           file_writing.score_format, file_writing.compress_scores,
+                           score_matrix.score_matrix_enabled, score_matrix.tile_size, profiling.profiling_enabled)
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initialize_worker,
+                                 initargs=worker_settings) as executor:
+            scheduled_jobs = []
+            for comparison_method in comparison_methods:
+                category = get_category(comparison_method)
+                for protocol in protocols:
+                    matrix_paths, probe_ids, gallery_ids, schroff_k, score_lists, _ = preprocessed[category, protocol]
+                    scheduled_jobs.append((comparison_method, protocol, executor.submit(
+                        run_job, comparison_method, protocol, matrix_paths, probe_ids, gallery_ids, schroff_k,
+                        score_lists, record_output
+                    )))
+
+            if record_output:
+                open_recognition_file()
+                # preprocessing times were recorded for all categories, they are set again for every job
+                reset_recognition()
+
+            # merge results in the order of the grid, independent of the order in which the jobs finish
+            for comparison_method, protocol, scheduled_job in scheduled_jobs:
+                positive_matches, runtime, results, shortlist, span_records = scheduled_job.result()
+                # spans of all worker processes are summed up
+                merge_span_records(span_records)
+                category = get_category(comparison_method)
+                _, probe_ids, gallery_ids, _, _, preprocess_time = preprocessed[category, protocol]
+                recognition_rate = "{:.2f}".format(positive_matches / len(probe_ids) * 100)
+                print(f"{Colors.BOLD}INFO: {Colors.ENDC}Finished {Colors.BOLD}{Colors.CRED}" + comparison_method +
+                      f"{Colors.ENDC} with protocol {Colors.CCYAN}" + protocol + f"{Colors.ENDC}: " +
+                      recognition_rate + "%")
+
+                if record_output:
+                    set_preprocess_time(get_preprocess_method(category, standardization_method), protocol,
+                                        preprocess_time)
+                    save_results(comparison_method, protocol, recognition_rate, runtime)
+                if shortlist:
+                    save_shortlist(comparison_method, protocol, get_id_samples(probe_ids),
+                                   get_id_samples(gallery_ids), *shortlist)
+                save_evaluation(comparison_method, protocol, results)
+
+            close_files()
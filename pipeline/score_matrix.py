@@ -0,0 +1,239 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import hashlib
+import json
+import math
+import numpy as np
+import pathlib
+import pipeline.matrices as matrices
+import time
+from helpers.colors import Colors
+from helpers.profiling import span
+from pipeline.matrices import QuantizedMatrix
+
+
+####################################################
+#                                                  #
+#                 Path Declaration                 #
+#                                                  #
+####################################################
+
+# store of score matrices with one directory per protocol, cohort variant, comparison method and variant of the
+# lists and parameters (e.g. close/small/wartmann/rank-list-wartmann_alpha1-wartmann_beta1)
+score_matrix_directory_path = "output/score-matrices/"
+
+# probe x gallery scores, ids of the rows and columns, layout of the tiles, finished tiles and their scoring times
+scores_filename = "scores.npy"
+rows_filename = "rows.json"
+columns_filename = "columns.json"
+layout_filename = "layout.json"
+tiles_filename = "tiles.npy"
+tile_times_filename = "tile-times.npy"
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# scores are only written to memory-mapped score matrices if enabled
+score_matrix_enabled = False
+# number of probes and gallery samples per tile (0 derives the size from the memory budget)
+tile_size = 0
+
+# lists and cohort the current scores are computed from (set during preprocessing)
+list_method = "features"
+cohort_variant = "none"
+
+# cpu time spent on the tiles scored by earlier runs of the last resumed score matrix
+resumed_runtime = 0.0
+
+
+# setter for score_matrix_enabled
+def set_score_matrix_enabled(value):
+    global score_matrix_enabled
+    score_matrix_enabled = value
+
+
+# setter for tile_size
+def set_tile_size(value):
+    global tile_size
+    tile_size = value
+
+
+# setter for list_method and cohort_variant
+def set_score_lists(list_value, cohort_value):
+    global list_method
+    global cohort_variant
+    list_method = list_value
+    cohort_variant = cohort_value
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to get the cohort variant of a category (the baseline uses no cohort)
+def get_cohort_variant(category, enable_larger_cohort):
+    if not category:
+        return "none"
+
+    return "large" if enable_larger_cohort else "small"
+
+
+# used to get the directory of the score matrix of a comparison method with its parameters on a protocol
+def get_score_matrix_directory(comparison_method, parameters, protocol, scored_lists, scored_cohort):
+    variant = "-".join([scored_lists] + ["%s%s" % (parameter, value) for parameter, value in parameters.items()])
+
+    return pathlib.Path(score_matrix_directory_path) / protocol / scored_cohort / comparison_method / variant
+
+
+# used to get the number of rows and columns per tile, a tile of float64 scores stays within the memory budget
+def get_tile_size():
+    return tile_size or max(int(math.sqrt(matrices.memory_budget // np.dtype(np.float64).itemsize)), 1)
+
+
+# used to split a number of rows (or columns) into tiles
+def get_tiles(number_of_rows, size):
+    return [slice(start, min(start + size, number_of_rows)) for start in range(0, number_of_rows, size)]
+
+
+# used to identify the content of the compared matrices, hence scores of other lists are never resumed
+def get_matrix_digest(*compared_matrices):
+    digest = hashlib.sha256()
+    for matrix in compared_matrices:
+        parts = [matrix.values, matrix.scales] if isinstance(matrix, QuantizedMatrix) else [matrix]
+        for part in parts:
+            part = np.ascontiguousarray(part)
+            digest.update(str((part.dtype, part.shape)).encode())
+            digest.update(part.data)
+
+    return digest.hexdigest()
+
+
+# used to get the ids of the rows or columns of a score matrix
+def get_ids(samples):
+    return {"reference_ids": [str(sample.reference_id) for sample in samples],
+            "subject_ids": [str(sample.subject_id) for sample in samples]}
+
+
+# used to read a json file, returns None if it does not exist
+def read_json(file):
+    if not file.is_file():
+        return None
+    with open(file) as json_dev:
+        return json.load(json_dev)
+
+
+# used to write a json file
+def write_json(file, content):
+    with open(file, "w") as json_dev:
+        json.dump(content, json_dev)
+
+
+# used to get the cpu time of the tiles scored by earlier runs of the last score matrix, hence the runtime of a
+# resumed score matrix is the runtime of all its tiles (the time is only reported once)
+def get_resumed_runtime():
+    global resumed_runtime
+    runtime = resumed_runtime
+    resumed_runtime = 0.0
+
+    return runtime
+
+
+# used to open the score matrix, the finished tiles and their scoring times of a directory, the tiles are kept if
+# the layout and the ids are unchanged, otherwise a new score matrix is created
+def open_score_matrix(directory, layout, rows, columns, number_of_tiles):
+    if read_json(directory / layout_filename) == layout and read_json(directory / rows_filename) == rows and \
+            read_json(directory / columns_filename) == columns and (directory / scores_filename).is_file() and \
+            (directory / tiles_filename).is_file() and (directory / tile_times_filename).is_file():
+        return np.load(str(directory / scores_filename), mmap_mode="r+"), \
+            np.load(str(directory / tiles_filename), mmap_mode="r+"), \
+            np.load(str(directory / tile_times_filename), mmap_mode="r+")
+
+    directory.mkdir(parents=True, exist_ok=True)
+    # finished tiles are removed first, hence an interrupted creation is never resumed
+    if (directory / tiles_filename).is_file():
+        (directory / tiles_filename).unlink()
+    write_json(directory / rows_filename, rows)
+    write_json(directory / columns_filename, columns)
+    write_json(directory / layout_filename, layout)
+    scores = np.lib.format.open_memmap(str(directory / scores_filename), mode="w+", dtype=np.float64,
+                                       shape=tuple(layout["shape"]))
+    tiles = np.lib.format.open_memmap(str(directory / tiles_filename), mode="w+", dtype=np.uint8,
+                                      shape=number_of_tiles)
+    tile_times = np.lib.format.open_memmap(str(directory / tile_times_filename), mode="w+", dtype=np.float64,
+                                           shape=number_of_tiles)
+
+    return scores, tiles, tile_times
+
+
+# used to check whether a directory holds a score matrix whose tiles are all finished
+def is_score_matrix_complete(directory):
+    directory = pathlib.Path(directory)
+    if not (directory / scores_filename).is_file() or not (directory / tiles_filename).is_file():
+        return False
+
+    return bool(np.all(np.load(str(directory / tiles_filename))))
+
+
+# used to open a finished score matrix read-only, returns the scores and the ids of its rows and columns
+def load_score_matrix(directory):
+    directory = pathlib.Path(directory)
+
+    return np.load(str(directory / scores_filename), mmap_mode="r"), read_json(directory / rows_filename), \
+        read_json(directory / columns_filename)
+
+
+####################################################
+#                                                  #
+#                    Algorithm                     #
+#                                                  #
+####################################################
+
+# used to score all probes against all gallery samples tile by tile into a memory-mapped score matrix,
+# finished tiles are recorded after their scores were flushed, hence an interrupted run resumes at the first
+# unfinished tile and the scoring time of the finished tiles is added to the runtime
+def score_tiles(comparison_method, parameters, matrix_function, probe_matrix, gallery_matrix, probe_samples,
+                gallery_samples, directory):
+    global resumed_runtime
+
+    size = get_tile_size()
+    row_tiles = get_tiles(len(probe_samples), size)
+    column_tiles = get_tiles(len(gallery_samples), size)
+    layout = {"comparison_method": comparison_method, "parameters": parameters,
+              "shape": [len(probe_samples), len(gallery_samples)], "tile_size": size,
+              "digest": get_matrix_digest(probe_matrix, gallery_matrix)}
+    scores, tiles, tile_times = open_score_matrix(pathlib.Path(directory), layout, get_ids(probe_samples),
+                                      get_ids(gallery_samples), (len(row_tiles), len(column_tiles)))
+
+    finished_tiles = int(np.sum(tiles))
+    resumed_runtime = float(np.sum(tile_times[tiles == 1]))
+    for row_tile, rows in enumerate(row_tiles):
+        for column_tile, columns in enumerate(column_tiles):
+            if tiles[row_tile, column_tile]:
+                continue
+            start_time_cpu = time.process_time()
+            with span("scoring"):
+                tile_scores = matrix_function(probe_matrix[rows], gallery_matrix[columns])
+            tile_time = time.process_time() - start_time_cpu
+            with span("output_writing"):
+                scores[rows, columns] = tile_scores
+                scores.flush()
+                tile_times[row_tile, column_tile] = tile_time
+                tile_times.flush()
+                tiles[row_tile, column_tile] = 1
+                tiles.flush()
+
+    if finished_tiles:
+        print(f"{Colors.BOLD}INFO: {Colors.ENDC}Resumed score matrix in '%s' (%d of %d tiles were finished)" %
+              (directory, finished_tiles, tiles.size))
+
+    return scores
@@ -0,0 +1,185 @@
+####################################################
+#                                                  #
+#                     Imports                      #
+#                                                  #
+####################################################
+
+import csv
+import numpy as np
+import pathlib
+from helpers.categories import get_category
+from pipeline.comparison import get_comparison_matrices, get_block_matches
+from pipeline.matrices import get_blocks
+from pipeline.preprocessing import run_preprocessing, get_preprocess_method
+
+
+####################################################
+#                                                  #
+#                 Global Variables                 #
+#                                                  #
+####################################################
+
+# available sweeps with swept comparison method and parameter columns of the written file
+sweeps = {
+    "wartmann_alpha": ("wartmann", ["alpha", "beta"]),
+    "wartmann_beta": ("wartmann", ["alpha", "beta"]),
+    "wartmann_both": ("wartmann", ["alpha", "beta"]),
+    "wartmann_various": ("wartmann", ["alpha", "beta"]),
+    "minkowski_p": ("minkowski", ["parameter_value"]),
+    "schroff_k": ("schroff", ["parameter_value"]),
+    "mueller2013_lambda": ("mueller2013", ["parameter_value"]),
+}
+
+# default parameter values (same grids as the files in plots and example_output/various_parameters)
+wartmann_values = [round(1 + step / 10, 1) for step in range(21)] + [*range(4, 15)]
+wartmann_various_values = [1.25 + step / 4 for step in range(8)]
+minkowski_values = [0.01] + [round(step / 10, 1) for step in range(1, 51)]
+mueller2013_values = [0.9, 0.95, 0.99]
+
+
+####################################################
+#                                                  #
+#                   Grid Methods                   #
+#                                                  #
+####################################################
+
+# compute wartmann similarities of a block of probes for all (alpha, beta) pairs of the grid
+def wartmann_grid(probe_ranks, gallery_ranks, grid):
+    number_of_ranks = probe_ranks.shape[1]
+    probe_ranks = probe_ranks.astype(np.float64)
+    gallery_ranks = gallery_ranks.astype(np.float64)
+    # rank differences and distances from the centre are shared by all parameters
+    rank_differences = np.abs(probe_ranks[:, None, :] - gallery_ranks[None, :, :]) / number_of_ranks
+    probe_centre_distances = np.abs((probe_ranks / (number_of_ranks * 0.5)) - 1)
+    gallery_centre_distances = np.abs((gallery_ranks / (number_of_ranks * 0.5)) - 1)
+
+    scores = [None] * len(grid)
+    # every power of the rank differences is computed once and reused for all betas
+    for alpha in sorted(set(alpha for alpha, _ in grid)):
+        powered_differences = rank_differences ** alpha
+        for index, (grid_alpha, beta) in enumerate(grid):
+            if grid_alpha == alpha:
+                scores[index] = -(np.einsum("pgc,pc->pg", powered_differences, probe_centre_distances ** beta) +
+                                  np.einsum("pgc,gc->pg", powered_differences, gallery_centre_distances ** beta))
+
+    return scores
+
+
+# compute minkowski similarities of a block of probes for all p of the grid
+def minkowski_grid(probe_lists, gallery_lists, grid):
+    # absolute differences are shared by all parameters
+    differences = np.abs(probe_lists[:, None, :] - gallery_lists[None, :, :])
+
+    return [-np.sum(differences ** p, axis=-1) ** (1 / p) for (p,) in grid]
+
+
+# compute schroff similarities of a block of probes for all k of the grid
+def schroff_grid(probe_ranks, gallery_ranks, grid):
+    probe_ranks = probe_ranks.astype(np.float64)
+    gallery_ranks = gallery_ranks.astype(np.float64)
+
+    return [np.maximum(k + 1 - probe_ranks, 0) @ np.maximum(k + 1 - gallery_ranks, 0).T for (k,) in grid]
+
+
+# compute mueller2013 similarities of a block of probes for all lambdas of the grid
+def mueller2013_grid(probe_ranks, gallery_ranks, grid):
+    probe_ranks = probe_ranks.astype(np.float64)
+    gallery_ranks = gallery_ranks.astype(np.float64)
+
+    return [np.power(decay, probe_ranks) @ np.power(decay, gallery_ranks).T for (decay,) in grid]
+
+
+####################################################
+#                                                  #
+#                  Helper Methods                  #
+#                                                  #
+####################################################
+
+# used to expand the swept values into the grid of parameter tuples
+def get_grid(sweep, values, number_of_ranks):
+    if sweep == "wartmann_alpha":
+        return [(alpha, 1) for alpha in values or wartmann_values]
+    elif sweep == "wartmann_beta":
+        return [(1, beta) for beta in values or wartmann_values]
+    elif sweep == "wartmann_both":
+        return [(value, value) for value in values or wartmann_values]
+    elif sweep == "wartmann_various":
+        values = values or wartmann_various_values
+        return [(alpha, beta) for alpha in values for beta in values if alpha != beta]
+    elif sweep == "minkowski_p":
+        return [(p,) for p in values or minkowski_values]
+    elif sweep == "schroff_k":
+        # multiples of ten up to the cohort size (which is the default schroff_k)
+        return [(k,) for k in values or [*range(10, number_of_ranks, 10), number_of_ranks]]
+    else:
+        return [(decay,) for decay in values or mueller2013_values]
+
+
+# used to count positive matches of every parameter of the grid
+def evaluate_grid(grid_function, grid, probe_samples, gallery_samples, probe_matrix, gallery_matrix):
+    positive_matches = np.zeros(len(grid), dtype=np.int64)
+    # shared intermediates and their powers hold one value per pair and rank
+    bytes_per_probe = 2 * len(gallery_samples) * probe_matrix.shape[1] * np.dtype(np.float64).itemsize
+    for block in get_blocks(len(probe_samples), bytes_per_probe):
+        for index, result in enumerate(grid_function(probe_matrix[block], gallery_matrix, grid)):
+            positive_matches[index] += get_block_matches(probe_samples[block], gallery_samples, result)
+
+    return positive_matches
+
+
+# used to get the filename read by the plot scripts (e.g. wartmann-small-alpha.csv, minkowski-large-omitted.csv)
+def get_sweep_filename(sweep, standardization_method, enable_larger_cohort):
+    comparison_method, _ = sweeps[sweep]
+    cohort_size = "large" if enable_larger_cohort else "small"
+    if comparison_method == "minkowski":
+        variant = standardization_method.replace("_", "-")
+    else:
+        variant = sweep[len(comparison_method) + 1:]
+
+    return comparison_method + "-" + cohort_size + "-" + variant + ".csv"
+
+
+# used to save recognition rates of all parameters, with one row per additionally finished protocol
+def save_sweep(filename, comparison_method, parameter_columns, preprocess_method, grid, recognition_rates):
+    pathlib.Path("output").mkdir(exist_ok=True)
+    protocols = ["close", "medium", "far"]
+
+    with open("output/" + filename, 'w', newline='') as sweep_dev:
+        sweep_writer = csv.writer(sweep_dev)
+        sweep_writer.writerow(['comparison_method', 'close_recog_rate (%)', 'medium_recog_rate (%)',
+                               'far_recog_rate (%)'] + parameter_columns + ['preprocess_method'])
+        for index, parameters in enumerate(grid):
+            rates = ["", "", ""]
+            for position, protocol in enumerate(protocols):
+                if protocol in recognition_rates:
+                    rates[position] = "{:.2f}".format(recognition_rates[protocol][index] * 100)
+                    sweep_writer.writerow([comparison_method] + rates +
+                                          ["{:g}".format(value) for value in parameters] + [preprocess_method])
+
+
+####################################################
+#                                                  #
+#                    Algorithm                     #
+#                                                  #
+####################################################
+
+# used to evaluate a whole parameter grid with a single preprocessing per protocol
+def run_sweep(sweep, values, protocols, standardization_method, enable_larger_cohort):
+    comparison_method, parameter_columns = sweeps[sweep]
+    category = get_category(comparison_method)
+    grid_function = eval(comparison_method + "_grid")
+    preprocess_method = get_preprocess_method(category, standardization_method)
+
+    grid = []
+    recognition_rates = {}
+    for protocol in protocols:
+        probe_samples, gallery_samples = run_preprocessing(category, protocol, standardization_method,
+                                                           enable_larger_cohort)
+        probe_matrix, gallery_matrix = get_comparison_matrices(probe_samples, gallery_samples, category)
+        grid = get_grid(sweep, values, probe_matrix.shape[1])
+        positive_matches = evaluate_grid(grid_function, grid, probe_samples, gallery_samples,
+                                         probe_matrix, gallery_matrix)
+        recognition_rates[protocol] = positive_matches / len(probe_samples)
+
+    filename = get_sweep_filename(sweep, standardization_method, enable_larger_cohort)
+    save_sweep(filename, comparison_method, parameter_columns, preprocess_method, grid, recognition_rates)